@@ -83,8 +83,6 @@ Get-ChildItem
 UninstallCuTENSOR $cuda_path
 
 # Verify
-echo ">> Validating with twine check..."
-RunOrDie $python_exe -m twine check --strict $wheel_file
 echo ">> Starting verification..."
 RunOrDie $python_exe ./dist.py --action verify --target wheel-win --python $python --cuda $cuda --dist $wheel_file --test release-tests/common --test release-tests/pkg_wheel
 
@@ -0,0 +1,90 @@
+"""
+Tracing of builder/verifier agents.
+
+This module is shared by `builder/agent.py` and `verifier/agent.py`, and is
+copied next to them into Docker build contexts (see `dist.py`).  Events are
+recorded in the Chrome trace event format, and merged into the trace of the
+controller (see `dist_trace.py`).
+"""
+from __future__ import annotations
+
+import json
+import sys
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+
+def _children_cpu_time() -> tuple[float, float]:
+    """Returns the user/system CPU time of terminated child processes."""
+    if sys.platform == 'win32':
+        return (0.0, 0.0)
+    import resource
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (usage.ru_utime, usage.ru_stime)
+
+
+def _children_max_rss() -> int | None:
+    """Returns the peak RSS (KiB) of the largest terminated child process."""
+    if sys.platform == 'win32':
+        return None
+    import resource
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+
+def _container_memory_peak() -> int | None:
+    """Returns the peak memory usage (KiB) of the container so far.
+
+    The usage is read from the cgroup, and thus covers all processes in the
+    container, unlike the peak RSS of a single process.
+    """
+    for path in [
+        '/sys/fs/cgroup/memory.peak',  # cgroup v2
+        '/sys/fs/cgroup/memory/memory.max_usage_in_bytes',  # cgroup v1
+    ]:
+        try:
+            with open(path, encoding='UTF-8') as f:
+                return int(f.read()) // 1024
+        except (OSError, ValueError):
+            continue
+    return None
+
+
+class AgentTrace:
+
+    def __init__(self) -> None:
+        self._events: list[dict[str, Any]] = []
+
+    @contextmanager
+    def span(self, name: str, cat: str) -> Iterator[dict[str, Any]]:
+        """Records the duration of the context as a span.
+
+        CPU time of child processes terminated during the context, the peak
+        RSS of the largest child process terminated so far, and the peak
+        memory usage of the container so far (if running in a container)
+        are also recorded.
+        """
+        args: dict[str, Any] = {}
+        start_cpu_time = _children_cpu_time()
+        start = time.time_ns() // 1000
+        try:
+            yield args
+        finally:
+            end = time.time_ns() // 1000
+            end_cpu_time = _children_cpu_time()
+            args['user_time'] = end_cpu_time[0] - start_cpu_time[0]
+            args['system_time'] = end_cpu_time[1] - start_cpu_time[1]
+            args['max_rss_kib'] = _children_max_rss()
+            args['memory_peak_kib'] = _container_memory_peak()
+            self._events.append({
+                'name': name, 'cat': cat, 'ph': 'X',
+                'ts': start, 'dur': end - start, 'args': args,
+            })
+
+    def write(self, path: str) -> None:
+        """Writes recorded events to the file."""
+        with open(path, 'w', encoding='UTF-8') as f:
+            json.dump(self._events, f)
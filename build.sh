@@ -52,6 +52,14 @@ if [[ "${CUPY_RELEASE_SKIP_VERIFY:-0}" != "1" ]]; then
   if [[ "${CUPY_RELEASE_VERIFY_REMOVE_IMAGE:-0}" = "1" ]]; then
     VERIFY_ARGS="${VERIFY_ARGS} --rmi"
   fi
-  python3 -m twine check --strict "${DIST_FILE_NAME}"
+  if [[ -n "${CUPY_RELEASE_VERIFY_JOBS:-}" ]]; then
+    VERIFY_ARGS="${VERIFY_ARGS} --jobs ${CUPY_RELEASE_VERIFY_JOBS}"
+  fi
+  if [[ -n "${CUPY_RELEASE_VERIFY_TEST_SHARDS:-}" ]]; then
+    VERIFY_ARGS="${VERIFY_ARGS} --test-shards ${CUPY_RELEASE_VERIFY_TEST_SHARDS}"
+  fi
+  if [[ "${CUPY_RELEASE_VERIFY_SMOKE_FIRST:-0}" = "1" ]]; then
+    VERIFY_ARGS="${VERIFY_ARGS} --smoke-first"
+  fi
   ./dist.py --action verify ${DIST_OPTIONS} --dist ${DIST_FILE_NAME} ${VERIFY_ARGS}
 fi
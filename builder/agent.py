@@ -5,11 +5,14 @@ from __future__ import annotations
 import argparse
 import os
 import shlex
+import shutil
 import subprocess
 import sys
 import time
 from typing import TYPE_CHECKING, Literal
 
+from agent_trace import AgentTrace
+
 if TYPE_CHECKING:
     from collections.abc import Mapping
 
@@ -17,14 +20,19 @@ if TYPE_CHECKING:
 class _BuilderAgentArgs(argparse.Namespace):
     action: Literal['sdist', 'wheel']
     source: str
-    python: str | None
+    python: list[str]
     requires: list[str]
+    cuda_opt_lib: str | None
+    trace: str | None
     chown: str | None
     env: list[str]
 
 
 class BuilderAgent:
 
+    def __init__(self) -> None:
+        self._trace = AgentTrace()
+
     @staticmethod
     def _log(msg: str) -> None:
         print(f'[BuilderAgent] [{time.asctime()}]: {msg}', flush=True)
@@ -33,7 +41,13 @@ class BuilderAgent:
         self, *cmd: str, env: Mapping[str, str] | None = None
     ) -> None:
         self._log(f'Running command: {shlex.join(cmd)}')
-        subprocess.check_call(cmd, env=env)
+        with self._trace.span(shlex.join(cmd), 'command') as span:
+            try:
+                subprocess.check_call(cmd, env=env)
+                span['exit_code'] = 0
+            except subprocess.CalledProcessError as e:
+                span['exit_code'] = e.returncode
+                raise
 
     @staticmethod
     def parse_args() -> _BuilderAgentArgs:
@@ -45,11 +59,19 @@ class BuilderAgent:
             '--source', type=str, required=True,
             help='Path to the CuPy source directory')
         parser.add_argument(
-            '--python', type=str,
-            help='Python version to use for setup')
+            '--python', action='append', type=str, default=[],
+            help='Python version to use for setup '
+                 '(can be specified for multiple times)')
         parser.add_argument(
             '--requires', action='append', type=str, default=[],
             help='Python requirements to install prior to setup')
+        parser.add_argument(
+            '--cuda-opt-lib', type=str,
+            help='Path to the directory containing optional CUDA libraries '
+                 'to install prior to setup')
+        parser.add_argument(
+            '--trace', type=str,
+            help='Path to write the trace in the Chrome trace event format')
         parser.add_argument(
             '--chown', type=str,
             help='Reset owner of files to the specified `uid:gid`')
@@ -75,32 +97,60 @@ class BuilderAgent:
             assert len(pair) == 2, 'invalid --env format'
             env[pair[0]] = pair[1]
 
-        pycommand = [sys.executable]
-        if args.python:
-            os.environ['PYENV_VERSION'] = args.python
-            self._log(f'Using Python {args.python}')
-            pycommand = ['pyenv', 'exec', 'python']
-        else:
-            self._log('Using Python from system')
-
-        if 0 < len(args.requires):
-            self._log('Installing python libraries...')
-            cmdline = [*pycommand, '-m', 'pip', 'install', *args.requires]
-            self._run(*cmdline)
+        if args.cuda_opt_lib is not None:
+            self._log('Installing optional CUDA libraries...')
+            self._run(
+                '/setup_cuda_opt_lib.py',
+                '--src', args.cuda_opt_lib, '--dst', '/usr/local/cuda')
 
         self._log('Changing directory to cupy source tree')
         os.chdir(args.source)
         try:
-            self._log('Running CuPy setup...')
-            cmdline = [*pycommand, '-m', 'build',
-                       '--no-isolation', f'--{args.action}']
-            if sys.platform.startswith('linux'):
-                cmdline = ['/build-wrapper', *cmdline]
-            self._run(*cmdline, env=os.environ | env)
+            if len(args.python) == 0:
+                self._log('Using Python from system')
+                self._build([sys.executable], args, env)
+                return
+            free_threaded = None
+            for python in args.python:
+                # Objects built for the GIL-enabled and free-threaded
+                # interpreters may share the same build directory; discard
+                # them when switching between them.  Other build products
+                # (e.g., Cython-generated sources) are reused.
+                if (free_threaded is not None and
+                        free_threaded != python.endswith('t') and
+                        os.path.isdir('build')):
+                    self._log('Removing build directory')
+                    shutil.rmtree('build')
+                free_threaded = python.endswith('t')
+                os.environ['PYENV_VERSION'] = python
+                self._log(f'Using Python {python}')
+                with self._trace.span(f'Build (Python {python})', 'group'):
+                    self._build(['pyenv', 'exec', 'python'], args, env)
         finally:
             if args.chown:
                 self._log('Resetting owner/group of the source tree...')
                 self._run('chown', '-R', args.chown, '.')
+            if args.trace:
+                self._log(f'Writing trace to: {args.trace}')
+                self._trace.write(args.trace)
+
+    def _build(
+        self,
+        pycommand: list[str],
+        args: _BuilderAgentArgs,
+        env: Mapping[str, str],
+    ) -> None:
+        if 0 < len(args.requires):
+            self._log('Installing python libraries...')
+            cmdline = [*pycommand, '-m', 'pip', 'install', *args.requires]
+            self._run(*cmdline)
+
+        self._log('Running CuPy setup...')
+        cmdline = [*pycommand, '-m', 'build',
+                   '--no-isolation', f'--{args.action}']
+        if sys.platform.startswith('linux'):
+            cmdline = ['/build-wrapper', *cmdline]
+        self._run(*cmdline, env=os.environ | env)
 
 
 if __name__ == '__main__':
@@ -2,35 +2,181 @@
 """
 This tool copies the directory tree created by the library installer
 (`cupyx.tools.install_library`) to $CUDA_PATH.
+
+Files are synchronized incrementally: files already installed are skipped,
+and files are hardlinked instead of copied when possible.  A manifest of
+installed files is kept in the destination directory so that later runs
+do not need to read the destination files.
 """
 from __future__ import annotations
 
 import argparse
+import hashlib
+import json
 import os
 import shutil
 import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any
 
 if TYPE_CHECKING:
     from collections.abc import Mapping
 
 
-def merge_directory(src_dir: Path, dst_dir: Path) -> None:
+# Name of the manifest file placed in the destination directory.
+_MANIFEST = '.cupy-opt-lib-manifest.json'
+
+# Files larger than this size (in bytes; e.g., `.so` and `.a` files) are
+# copied in parallel.
+_LARGE_FILE_SIZE = 4 * 1024 * 1024
+
+
+def _sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(1024 * 1024):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class _Sync:
+    """Synchronizes files to the destination directory."""
+
+    def __init__(
+        self, dst_root: Path, *, dry_run: bool, verbose: bool, jobs: int
+    ) -> None:
+        self._dst_root = dst_root
+        self._dry_run = dry_run
+        self._verbose = verbose
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=jobs)
+        self._futures: list[Future[None]] = []
+        self._manifest: dict[str, dict[str, Any]] = {}
+        manifest_path = dst_root / _MANIFEST
+        if manifest_path.exists():
+            with open(manifest_path, encoding='UTF-8') as f:
+                self._manifest = json.load(f)
+        self.stats = {'linked': 0, 'copied': 0, 'skipped': 0, 'bytes': 0}
+
+    def _log(self, msg: str) -> None:
+        if self._verbose or self._dry_run:
+            print(msg, flush=True)
+
+    def _is_synced(
+        self, src: Path, dst: Path, src_stat: os.stat_result
+    ) -> bool:
+        try:
+            dst_stat = dst.stat()
+        except FileNotFoundError:
+            return False
+        if src_stat.st_size != dst_stat.st_size:
+            return False
+        if src_stat.st_mtime_ns == dst_stat.st_mtime_ns:
+            return True
+        # Compare contents; use the digest recorded in the manifest for the
+        # destination file if it is not modified since then.
+        entry = self._manifest_entry(dst)
+        dst_digest = _sha256(dst) if entry is None else entry['sha256']
+        return _sha256(src) == dst_digest
+
+    def _manifest_entry(self, dst: Path) -> dict[str, Any] | None:
+        """Returns the manifest entry if the file is not modified since."""
+        dst_stat = dst.stat()
+        with self._lock:
+            entry = self._manifest.get(str(dst.relative_to(self._dst_root)))
+        if (entry is not None and
+                entry['size'] == dst_stat.st_size and
+                entry['mtime_ns'] == dst_stat.st_mtime_ns):
+            return entry
+        return None
+
+    def _record(self, dst: Path, src: Path, stat: str, size: int) -> None:
+        entry = None
+        if not self._dry_run and self._manifest_entry(dst) is None:
+            dst_stat = dst.stat()
+            entry = {
+                'size': dst_stat.st_size,
+                'mtime_ns': dst_stat.st_mtime_ns,
+                'sha256': _sha256(src),
+            }
+        with self._lock:
+            self.stats[stat] += 1
+            if stat != 'skipped':
+                self.stats['bytes'] += size
+            if entry is not None:
+                self._manifest[str(dst.relative_to(self._dst_root))] = entry
+
+    def _copy(self, src: Path, dst: Path, size: int) -> None:
+        # Never overwrite in-place as the destination may be hardlinked.
+        dst.unlink(missing_ok=True)
+        shutil.copy2(src, dst)
+        self._record(dst, src, 'copied', size)
+
+    def file(self, src: Path, dst: Path) -> None:
+        """Synchronizes the file."""
+        src_stat = src.stat()
+        if self._is_synced(src, dst, src_stat):
+            self._log(f'Skipping: {dst} (up-to-date)')
+            self._record(dst, src, 'skipped', src_stat.st_size)
+            return
+        if self._dry_run:
+            self._log(f'Installing: {dst} <- {src}')
+            self._record(dst, src, 'copied', src_stat.st_size)
+            return
+        if src_stat.st_dev == dst.parent.stat().st_dev:
+            self._log(f'Linking: {dst} <- {src}')
+            dst.unlink(missing_ok=True)
+            try:
+                os.link(src, dst)
+                self._record(dst, src, 'linked', src_stat.st_size)
+                return
+            except OSError:
+                # Hardlink is unsupported; fallback to copy.
+                pass
+        self._log(f'Copying: {dst} <- {src}')
+        if _LARGE_FILE_SIZE <= src_stat.st_size:
+            self._futures.append(
+                self._executor.submit(self._copy, src, dst, src_stat.st_size))
+        else:
+            self._copy(src, dst, src_stat.st_size)
+
+    def directory(self, src_dir: Path, dst_dir: Path) -> None:
+        """Merges two directory trees."""
+        # MEMO: Path.walk is only available from py3.12
+        for srcpath, files in (
+            (Path(srcpath), files) for srcpath, _, files in os.walk(src_dir)
+        ):
+            dstpath = dst_dir / srcpath.relative_to(src_dir)
+            if not dstpath.exists():
+                self._log(f'Creating directory: {dstpath}')
+                if not self._dry_run:
+                    dstpath.mkdir()
+            for f in files:
+                self.file(srcpath / f, dstpath / f)
+
+    def finish(self) -> None:
+        """Waits for copies and writes the manifest."""
+        self._executor.shutdown()
+        for future in self._futures:
+            future.result()
+        if not self._dry_run:
+            manifest_path = self._dst_root / _MANIFEST
+            with open(f'{manifest_path}.tmp', 'w', encoding='UTF-8') as f:
+                json.dump(self._manifest, f, indent=1, sort_keys=True)
+            os.replace(f'{manifest_path}.tmp', manifest_path)
+        stats = self.stats
+        print(f'{"Would install" if self._dry_run else "Installed"} '
+              f'{stats["linked"] + stats["copied"]} files '
+              f'({stats["linked"]} linked, {stats["copied"]} copied, '
+              f'{stats["bytes"] / 1024 ** 2:.1f} MiB), '
+              f'{stats["skipped"]} files up-to-date', flush=True)
+
+
+def merge_directory(src_dir: Path, dst_dir: Path, sync: _Sync) -> None:
     """Merge two directory trees."""
-    # MEMO: Path.walk is only available from py3.12
-    for srcpath, files in (
-        (Path(srcpath), files) for srcpath, _, files in os.walk(src_dir)
-    ):
-        dstpath = dst_dir / srcpath.relative_to(src_dir)
-        if not dstpath.exists():
-            print(f'Creating directory: {dstpath}')
-            dstpath.mkdir()
-        for f in files:
-            srcfile = srcpath / f
-            dstfile = dstpath / f
-            print(f'Copying: {dstfile} <- {srcfile}')
-            shutil.copy2(srcfile, dstfile)
+    sync.directory(src_dir, dst_dir)
 
 
 def _child(path: Path) -> Path | None:
@@ -47,6 +193,7 @@ def _install_library(
     src_dir: Path,
     dst_dir: Path,
     install_map: Mapping[str, str],
+    sync: _Sync,
 ) -> None:
     # $src_dir/$CUDA_VERSION/$name/$LIB_VERSION
     src_dir_ = _child(src_dir)  # $CUDA_VERSION
@@ -60,50 +207,64 @@ def _install_library(
     src_dir_ = _child(src_dir_)  # $LIB_VERSION
     assert src_dir_ is not None
 
+    print(f'Installing {name} from {src_dir_}')
     for child in src_dir_.iterdir():
         dst_name = install_map.get(child.name, child.name)
         if child.is_dir():
-            merge_directory(child, dst_dir / dst_name)
+            merge_directory(child, dst_dir / dst_name, sync)
         else:
-            dstfile = dst_dir / dst_name
-            print(f'Copying: {dstfile} <- {child}')
-            shutil.copy2(child, dstfile)
+            sync.file(child, dst_dir / dst_name)
 
 
 class _OptLibArgs(argparse.Namespace):
     src: str
     dst: str
+    dry_run: bool
+    verbose: bool
+    jobs: int
 
 
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument('--src', type=str, required=True)
     parser.add_argument('--dst', type=str, required=True)
+    parser.add_argument(
+        '--dry-run', action='store_true', default=False,
+        help='only show files to be installed')
+    parser.add_argument(
+        '--verbose', action='store_true', default=False,
+        help='show each file installed')
+    parser.add_argument(
+        '--jobs', type=int, default=4,
+        help='number of large files to copy concurrently')
     args = parser.parse_args(namespace=_OptLibArgs())
 
     src_dir = Path(args.src)
     dst_dir = Path(args.dst)
+    sync = _Sync(
+        dst_dir, dry_run=args.dry_run, verbose=args.verbose, jobs=args.jobs)
 
     if sys.platform == 'linux':
         _install_library(
             'cutensor', src_dir, dst_dir, {
                 'lib': 'lib64',
                 'include': 'include',
-            })
+            }, sync)
         _install_library(
             'nccl', src_dir, dst_dir, {
                 'lib': 'lib64',
                 'include': 'include',
-            })
+            }, sync)
     elif sys.platform == 'win32':
         _install_library(
             'cutensor', src_dir, dst_dir, {
                 'bin': 'bin',
                 'lib': 'lib/x64',
                 'include': 'include',
-            })
+            }, sync)
     else:
         raise AssertionError(f'Unsupported platform: {sys.platform}.')
+    sync.finish()
 
 
 if __name__ == '__main__':
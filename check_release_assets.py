@@ -2,13 +2,25 @@
 from __future__ import annotations
 
 import argparse
+import hashlib
 import itertools
+import json
 import os
 import subprocess
 import sys
-from typing import TYPE_CHECKING
-
-import distlib.locators
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any
+
+from packaging.utils import (
+    InvalidSdistFilename,
+    InvalidWheelFilename,
+    canonicalize_name,
+    parse_sdist_filename,
+    parse_wheel_filename,
+)
+from packaging.version import Version
 
 if TYPE_CHECKING:
     from collections.abc import Iterable, Mapping, Sequence
@@ -57,16 +69,85 @@ pypi_wheel_projects = {
 
 github_wheel_projects = pypi_wheel_projects
 
-
-def get_basenames(project: str, version: str) -> list[str]:
-    # List all wheels including unsupported ones by the current Python
-    distlib.locators.is_compatible = lambda *_: True
-    locator = distlib.locators.SimpleScrapingLocator(
-        'https://pypi.org/simple/')
-    proj: dict[str, str] = locator.get_project(project)['urls']
-    if version not in proj:
-        return []
-    return [os.path.basename(url) for url in proj[version]]
+default_index_url = 'https://pypi.org/simple/'
+default_cache_dir = os.path.join(
+    os.path.expanduser('~'), '.cache', 'cupy-release-tools', 'simple')
+
+# PEP 691 JSON-based Simple API.
+_SIMPLE_JSON = 'application/vnd.pypi.simple.v1+json'
+
+
+def get_project_files(
+    project: str, index_url: str, cache_dir: str | None
+) -> list[str]:
+    """Returns names of all files of the project on the package index.
+
+    The response is cached in `cache_dir` and revalidated with a
+    conditional request (ETag/Last-Modified).
+    """
+    url = f'{index_url.rstrip("/")}/{canonicalize_name(project)}/'
+    cache_path = None
+    cache: dict[str, Any] = {}
+    if cache_dir is not None:
+        key = hashlib.sha256(url.encode('UTF-8')).hexdigest()[:16]
+        cache_path = os.path.join(
+            cache_dir, f'{canonicalize_name(project)}-{key}.json')
+        if os.path.exists(cache_path):
+            with open(cache_path, encoding='UTF-8') as f:
+                cache = json.load(f)
+
+    request = urllib.request.Request(url, headers={'Accept': _SIMPLE_JSON})
+    if 'etag' in cache:
+        request.add_header('If-None-Match', cache['etag'])
+    if 'last_modified' in cache:
+        request.add_header('If-Modified-Since', cache['last_modified'])
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            body = json.load(response)
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return [x['filename'] for x in cache['body']['files']]
+        if e.code == 404:
+            return []
+        raise
+
+    if cache_path is not None and (etag or last_modified):
+        cache = {'body': body}
+        if etag:
+            cache['etag'] = etag
+        if last_modified:
+            cache['last_modified'] = last_modified
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        # Write to a temporary file first as the cache may be shared among
+        # concurrent runs.
+        with open(f'{cache_path}.{os.getpid()}.tmp', 'w',
+                  encoding='UTF-8') as f:
+            json.dump(cache, f)
+        os.replace(f'{cache_path}.{os.getpid()}.tmp', cache_path)
+    return [x['filename'] for x in body['files']]
+
+
+def get_basenames(
+    project: str,
+    version: str,
+    index_url: str = default_index_url,
+    cache_dir: str | None = None,
+) -> list[str]:
+    # List all files including wheels unsupported by the current Python
+    basenames = []
+    for filename in get_project_files(project, index_url, cache_dir):
+        try:
+            if filename.endswith('.whl'):
+                _, file_version, _, _ = parse_wheel_filename(filename)
+            else:
+                _, file_version = parse_sdist_filename(filename)
+        except (InvalidWheelFilename, InvalidSdistFilename):
+            continue
+        if file_version == Version(version):
+            basenames.append(filename)
+    return basenames
 
 
 def get_basenames_github(version: str) -> list[str]:
@@ -129,6 +210,10 @@ class _LibAssetsArgs(argparse.Namespace):
     github: bool
     pypi_sdist: bool
     pypi_wheel: bool
+    index_url: str
+    cache_dir: str
+    no_cache: bool
+    jobs: int
 
 
 def parse_args(argv: Sequence[str]) -> _LibAssetsArgs:
@@ -137,6 +222,20 @@ def parse_args(argv: Sequence[str]) -> _LibAssetsArgs:
     parser.add_argument('--github', action='store_true', default=False)
     parser.add_argument('--pypi-sdist', action='store_true', default=False)
     parser.add_argument('--pypi-wheel', action='store_true', default=False)
+    parser.add_argument(
+        '--index-url', default=default_index_url,
+        help='base URL of the package index (PEP 691 JSON Simple API) '
+             f'(default: {default_index_url})')
+    parser.add_argument(
+        '--cache-dir', default=default_cache_dir,
+        help='path to the directory to cache responses from the package '
+             f'index (default: {default_cache_dir})')
+    parser.add_argument(
+        '--no-cache', action='store_true', default=False,
+        help='do not use the response cache')
+    parser.add_argument(
+        '--jobs', type=int, default=8,
+        help='number of concurrent requests (default: 8)')
     return parser.parse_args(argv[1:], namespace=_LibAssetsArgs())
 
 
@@ -149,8 +248,26 @@ def main(argv: Sequence[str]) -> int:
 
     success = True
 
+    # Fetch assets concurrently, then verify them in order.
+    index_url = options.index_url
+    cache_dir = None if options.no_cache else options.cache_dir
+    with ThreadPoolExecutor(max_workers=options.jobs) as executor:
+        github_assets = None
+        if options.github:
+            github_assets = executor.submit(get_basenames_github, version)
+        pypi_projects = []
+        if options.pypi_sdist:
+            pypi_projects.append(sdist_project)
+        if options.pypi_wheel:
+            pypi_projects += [p for p, _ in pypi_wheel_projects[branch]]
+        pypi_assets = {
+            project: executor.submit(
+                get_basenames, project, version, index_url, cache_dir)
+            for project in pypi_projects
+        }
+
     # Verify assets on GitHub release
-    if options.github:
+    if github_assets is not None:
         expected_gh = [
             *itertools.chain.from_iterable(
                 get_expected_wheels(github_wheel_projects, version).values()
@@ -160,17 +277,17 @@ def main(argv: Sequence[str]) -> int:
         success = verify(
             'GitHub Release',
             expected_gh,
-            get_basenames_github(version)) and success
+            github_assets.result()) and success
 
     if options.pypi_sdist:
         expected_sdist = [get_expected_sdist_basename(sdist_project, version)]
-        actual = get_basenames(sdist_project, version)
+        actual = pypi_assets[sdist_project].result()
         success = verify(sdist_project, expected_sdist, actual) and success
 
     if options.pypi_wheel:
         expected_whl = get_expected_wheels(pypi_wheel_projects, version)
         for project, _ in pypi_wheel_projects[branch]:
-            actual = get_basenames(project, version)
+            actual = pypi_assets[project].result()
             success = verify(
                 f'PyPI: {project}', expected_whl[project], actual) and success
 
@@ -3,33 +3,81 @@
 from __future__ import annotations
 
 import argparse
+import collections
+import gzip
+import itertools
 import json
 import os
 import platform
+import re
 import shlex
 import shutil
 import subprocess
 import sys
 import sysconfig
+import tarfile
 import tempfile
+import threading
 import time
 import typing
-from contextlib import contextmanager
-from typing import Any, Literal
+import xml.etree.ElementTree as ET
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager, nullcontext
+from typing import Any, Literal, ParamSpec, TypeVar
 
 import tomli
 import tomli_w
 
+from dist_cache import (
+    cache_key,
+    check_wheelhouse_lock,
+    compiler_cache_dir,
+    evict_lru,
+    file_sha256,
+    read_build_requirements,
+    read_dist_requirements,
+    touch,
+    tree_digest,
+    wheelhouse_lock_path,
+    write_wheelhouse_lock,
+)
 from dist_config import (
     CUPY_MAJOR_VERSION,
     SDIST_CONFIG,
     SDIST_LONG_DESCRIPTION,
+    VERIFY_NCCL_VERSION,
     WHEEL_LINUX_CONFIGS,
     WHEEL_LONG_DESCRIPTION_CUDA,
     WHEEL_LONG_DESCRIPTION_ROCM,
     WHEEL_PYTHON_VERSIONS,
     WHEEL_WINDOWS_CONFIGS,
 )
+from dist_history import (
+    history_step,
+    note_max_rss,
+    record_sub_step,
+    set_history_path,
+)
+from dist_plan import (
+    build_plan,
+    critical_path,
+    estimate_durations,
+    export_plan,
+    find_traces,
+    format_duration,
+    load_history,
+    simulate,
+    suggest_workers,
+)
+from dist_snapshot import (
+    SNAPSHOT_MODES,
+    SnapshotMode,
+    fingerprint_source_tree,
+    get_source_date_epoch,
+    list_modified_files,
+    snapshot_source_tree,
+)
+from dist_trace import merge_trace, trace_instant, trace_span, write_trace
 from dist_utils import (
     get_system_cuda_version,
     get_version_from_source_tree,
@@ -37,13 +85,75 @@ from dist_utils import (
     wheel_linux_platform_tag,
     wheel_name,
 )
+from dist_wheel import (
+    check_dist,
+    find_size_baseline,
+    format_size_report,
+    rewrite_wheel,
+    wheel_size_report,
+)
 
 if typing.TYPE_CHECKING:
-    from collections.abc import Collection, Iterable, Iterator, Mapping
+    from collections.abc import (
+        Callable,
+        Collection,
+        Iterable,
+        Iterator,
+        Mapping,
+        Sequence,
+    )
+    from contextlib import AbstractContextManager
+
+
+_P = ParamSpec('_P')
+_T = TypeVar('_T')
+
+
+_log_local = threading.local()
+
+
+_log_lock = threading.Lock()
+
+
+# Label of Docker images to record the fingerprint of the image.
+_IMAGE_FINGERPRINT_LABEL = 'io.cupy.release-tools.fingerprint'
+
+
+# Files shared by the builder and the verifier, copied into their Docker
+# build contexts.
+_SHARED_CONTEXT_FILES = ['agent_trace.py', 'install_python.sh']
+
+
+# Number of last lines of the command output shown on failure.
+_COMMAND_TAIL_LINES = 100
+
+
+# Directory to write logs of commands (see `set_command_log_dir`).
+_command_log_dir: str | None = None
+_command_log_count = itertools.count(1)
 
 
 def log(msg: str) -> None:
-    print(f'[{time.asctime()}]: {msg}', flush=True)
+    label = getattr(_log_local, 'label', None)
+    stream = getattr(_log_local, 'stream', None)
+    trace_instant(msg, 'log', label=label)
+    prefix = f'[{time.asctime()}]' if label is None else \
+        f'[{time.asctime()}] [{label}]'
+    # Emit the line at once as logs may be emitted from multiple threads.
+    print(f'{prefix}: {msg}\n', end='', file=stream, flush=True)
+
+
+@contextmanager
+def log_label(label: str) -> Iterator[None]:
+    """
+    Prefixes log messages emitted from the current thread with the label.
+    """
+    prev = getattr(_log_local, 'label', None)
+    _log_local.label = label
+    try:
+        yield
+    finally:
+        _log_local.label = prev
 
 
 @contextmanager
@@ -51,9 +161,103 @@ def log_group(title: str) -> Iterator[None]:
     """
     Emits a log group (for GitHub Actions).
     """
-    print(f'::group::{title}')
-    yield
-    print('::endgroup::')
+    print(f'::group::{title}', flush=True)
+    with trace_span(title, 'group'):
+        yield
+    print('::endgroup::', flush=True)
+
+
+@contextmanager
+def log_buffered(title: str) -> Iterator[None]:
+    """
+    Buffers logs and outputs of commands run from the current thread, and
+    emits them at once as a log group when exiting the context.
+    """
+    with tempfile.TemporaryFile('w+', encoding='UTF-8') as stream:
+        _log_local.stream = stream
+        try:
+            with trace_span(title, 'group'):
+                yield
+        finally:
+            _log_local.stream = None
+            stream.seek(0)
+            with _log_lock:
+                print(f'::group::{title}', flush=True)
+                shutil.copyfileobj(stream, sys.stdout)
+                print('::endgroup::', flush=True)
+
+
+def bind_log_context(func: Callable[_P, _T]) -> Callable[_P, _T]:
+    """
+    Returns a function that runs `func` with the log label and stream of the
+    current thread, to be called from other threads.
+    """
+    label = getattr(_log_local, 'label', None)
+    stream = getattr(_log_local, 'stream', None)
+
+    def wrapper(*args: _P.args, **kwargs: _P.kwargs) -> _T:
+        _log_local.label = label
+        _log_local.stream = stream
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _log_local.label = None
+            _log_local.stream = None
+    return wrapper
+
+
+def set_command_log_dir(path: str | None) -> None:
+    """Sets the directory to write the full output of each command.
+
+    Outputs of commands run by `run_command` are written with timestamps
+    to gzip-compressed files in the directory.
+    """
+    global _command_log_dir
+    if path is not None:
+        os.makedirs(path, exist_ok=True)
+    _command_log_dir = path
+
+
+def _command_log_path(cmd: Sequence[str]) -> str | None:
+    if _command_log_dir is None:
+        return None
+    label = getattr(_log_local, 'label', None)
+    name = '-'.join([
+        *([label] if label is not None else []),
+        *(os.path.basename(x) for x in cmd[:2]),
+    ])
+    name = re.sub(r'[^A-Za-z0-9_.-]+', '_', name)[:80]
+    return (f'{_command_log_dir}/'
+            f'{next(_command_log_count):04d}-{name}.log.gz')
+
+
+def _pump_output(
+    pipe: typing.IO[bytes],
+    stream: typing.IO[str] | None,
+    log_path: str | None,
+    tail: collections.deque[str],
+) -> None:
+    """Copies the output of the command to the console (or the log stream).
+
+    Each line is also kept in `tail`, and written to `log_path` with the
+    time elapsed since the start.  The pipe is always drained to the end
+    so that the command never blocks on writing the output.
+    """
+    start = time.monotonic()
+    with (
+        gzip.open(log_path, 'wt', encoding='UTF-8', compresslevel=6)
+        if log_path is not None else nullcontext()
+    ) as archive:
+        for line in iter(pipe.readline, b''):
+            text = line.decode('UTF-8', errors='replace')
+            if stream is None:
+                sys.stdout.buffer.write(line)
+                sys.stdout.buffer.flush()
+            else:
+                stream.write(text)
+            tail.append(text)
+            if archive is not None:
+                archive.write(f'[{time.monotonic() - start:10.3f}] {text}')
 
 
 def run_command(
@@ -61,17 +265,89 @@ def run_command(
     extra_env: Mapping[str, str] | None = None,
     cwd: str | None = None,
 ) -> None:
+    """Runs the command, streaming its output.
+
+    The output (stdout and stderr) is copied to the console or the log
+    stream of the current thread (see `log_buffered`), and the last lines
+    are shown again on failure.  If the log directory is set (see
+    `set_command_log_dir`), the full output is also written to it.
+    """
     env = None
     if extra_env is not None:
         env = os.environ.copy()
         env.update(extra_env)
     log(f'Running command: {shlex.join(cmd)}')
-    subprocess.check_call(cmd, env=env, cwd=cwd, encoding='UTF-8')
+    stream = getattr(_log_local, 'stream', None)
+    log_path = _command_log_path(cmd)
+    tail: collections.deque[str] = collections.deque(
+        maxlen=_COMMAND_TAIL_LINES)
+    with trace_span(shlex.join(cmd), 'command', log=log_path) as span:
+        sys.stdout.flush()
+        proc = subprocess.Popen(
+            cmd, env=env, cwd=cwd,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        assert proc.stdout is not None
+        pump = threading.Thread(
+            target=_pump_output,
+            args=(proc.stdout, stream, log_path, tail),
+            name=f'{threading.current_thread().name}-output')
+        pump.start()
+        try:
+            _wait_command(proc, span, close_stdout=False)
+        finally:
+            pump.join()
+            proc.stdout.close()
+    if proc.returncode != 0:
+        log(f'Command failed with exit code {proc.returncode}; '
+            f'last {len(tail)} lines of the output:')
+        for line in tail:
+            log(f'  | {line.rstrip()}')
+        if log_path is not None:
+            log(f'Full output: {log_path}')
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
 
 
 def run_command_output(*cmd: str, cwd: str | None = None) -> str:
     log(f'Running command: {shlex.join(cmd)}')
-    return subprocess.check_output(cmd, cwd=cwd, encoding='UTF-8')
+    with trace_span(shlex.join(cmd), 'command') as span:
+        proc = subprocess.Popen(
+            cmd, cwd=cwd, encoding='UTF-8', stdout=subprocess.PIPE)
+        assert proc.stdout is not None
+        output = proc.stdout.read()
+        _wait_command(proc, span)
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, output)
+    return output
+
+
+def _wait_command(
+    proc: subprocess.Popen[Any],
+    span: dict[str, Any],
+    close_stdout: bool = True,
+) -> None:
+    """Waits for the process and records its exit code and CPU time."""
+    try:
+        if hasattr(os, 'wait4'):
+            # Obtain the resource usage of the process itself, as the usage
+            # of children (`RUSAGE_CHILDREN`) is shared among threads.
+            _, status, rusage = os.wait4(proc.pid, 0)
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            span['user_time'] = rusage.ru_utime
+            span['system_time'] = rusage.ru_stime
+            # This is the usage of the command itself (e.g., `docker run`),
+            # not of the container; the peak memory usage of steps is taken
+            # from traces of agents instead (see `_run_container`).
+            span['max_rss_kib'] = rusage.ru_maxrss
+        else:
+            proc.wait()
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        raise
+    finally:
+        if close_stdout and proc.stdout is not None:
+            proc.stdout.close()
+    span['exit_code'] = proc.returncode
 
 
 def get_current_python_version() -> str:
@@ -106,19 +382,131 @@ def generate_wheel_metadata(
 
 
 def install_cuda_opt_library(
-    library: str, cuda_version: str, arch: str, prefix: str, *, workdir: str
+    library: str, cuda_version: str, arch: str, prefix: str, *,
+    source: str, workdir: str,
 ) -> None:
     """Installs the library to the prefix."""
     command = [
         sys.executable,
-        'cupy/cupyx/tools/install_library.py',
+        f'{source}/cupyx/tools/install_library.py',
         '--library', library,
         '--cuda', cuda_version,
         '--arch', arch,
         '--prefix', prefix,
     ]
     log(f'Extracting the library to {prefix}')
-    run_command(*command, '--action', 'install', cwd=workdir)
+    with history_step('opt-lib', f'{library}:{cuda_version}:{arch}'):
+        run_command(*command, '--action', 'install', cwd=workdir)
+
+
+def install_cuda_opt_libraries(
+    libraries: Sequence[str], cuda_version: str, arch: str, prefix: str, *,
+    source: str, workdir: str, cache: str | None = None, cache_size: int = 10,
+) -> None:
+    """Installs the libraries to the prefix concurrently.
+
+    If `cache` is given, files installed for each library are cached as a
+    tarball (with its SHA256 checksum) keyed by the library, the CUDA
+    version, the architecture and the digest of the installer, which defines
+    versions of libraries.  Least-recently-used entries are evicted to keep
+    the cache within `cache_size` GiB.
+    """
+    if len(libraries) == 0:
+        return
+    if cache is not None:
+        cache = os.path.abspath(cache)
+        os.makedirs(cache, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=len(libraries)) as executor:
+        futures = [
+            executor.submit(bind_log_context(_install_cuda_opt_library_cached),
+                            library, cuda_version, arch, prefix, source,
+                            workdir, cache)
+            for library in libraries
+        ]
+        keys = [future.result() for future in futures]
+    if cache is not None:
+        for name in evict_lru(cache, cache_size * 1024 ** 3, keep=keys):
+            log(f'Evicted optional CUDA library cache: {name}')
+
+
+def _install_cuda_opt_library_cached(
+    library: str, cuda_version: str, arch: str, prefix: str, source: str,
+    workdir: str, cache: str | None,
+) -> str:
+    """Installs the library to the prefix, using the cache if available.
+
+    The checksum recorded next to the cached library (`*.tar.sha256`) only
+    detects corruption of the cache; the library downloaded by the installer
+    is not verified against upstream digests, which are not provided.
+    Returns the name of the cache entry.
+    """
+    if cache is None:
+        install_cuda_opt_library(
+            library, cuda_version, arch, prefix,
+            source=source, workdir=workdir)
+        return ''
+
+    installer = os.path.join(
+        workdir, source, 'cupyx', 'tools', 'install_library.py')
+    key = (f'{library}-{cuda_version}-{arch}-'
+           f'{cache_key(file_sha256(installer))[:16]}')
+    entry = f'{cache}/{key}'
+    tarball = f'{entry}/{library}.tar'
+    if os.path.exists(tarball):
+        with open(f'{tarball}.sha256', encoding='UTF-8') as f:
+            checksum = f.read().split()[0]
+        if file_sha256(tarball) == checksum:
+            log(f'Extracting the library from cache: {entry}')
+            touch(entry)
+            with tarfile.open(tarball) as t:
+                t.extractall(prefix, filter='data')
+            return key
+        log(f'WARNING: cache is corrupted (checksum mismatch), discarding: '
+            f'{entry}')
+        shutil.rmtree(entry, ignore_errors=True)
+
+    # Install to a dedicated prefix so that files of the library can be
+    # archived separately.
+    library_prefix = tempfile.mkdtemp(prefix=f'optlib-{library}-', dir=workdir)
+    try:
+        install_cuda_opt_library(
+            library, cuda_version, arch, library_prefix,
+            source=source, workdir=workdir)
+        log(f'Storing the library to cache: {entry}')
+        # Populate in a temporary directory first as the cache may be shared
+        # among concurrent builds.
+        tmpdir = tempfile.mkdtemp(prefix='.tmp-', dir=cache)
+        with tarfile.open(f'{tmpdir}/{library}.tar', 'w') as t:
+            t.add(library_prefix, arcname='.')
+        with open(f'{tmpdir}/{library}.tar.sha256', 'w',
+                  encoding='UTF-8') as f:
+            f.write(f'{file_sha256(f"{tmpdir}/{library}.tar")}  '
+                    f'{library}.tar\n')
+        try:
+            os.rename(tmpdir, entry)
+        except OSError:
+            # Stored by another build.
+            shutil.rmtree(tmpdir)
+        shutil.copytree(
+            library_prefix, prefix, symlinks=True, dirs_exist_ok=True)
+    finally:
+        shutil.rmtree(library_prefix)
+    return key
+
+
+def snapshot_source(source: str, dest: str, mode: SnapshotMode) -> None:
+    """Creates a clean snapshot of the source tree."""
+    log(f'Creating snapshot of source tree from: {source} ({mode})')
+    if mode != 'copy' and os.path.exists(f'{source}/.git'):
+        modified = list_modified_files(source)
+        if 0 < len(modified):
+            log(f'WARNING: source tree has local modifications: {modified}')
+    stats = snapshot_source_tree(source, dest, mode)
+    if len(stats) == 0:
+        log('Copied the whole source tree')
+    else:
+        log('Snapshot created: ' + ', '.join(
+            f'{k}={v}' for k, v in stats.items()))
 
 
 def rename_project(src: str, name: str) -> None:
@@ -128,22 +516,49 @@ def rename_project(src: str, name: str) -> None:
     with open(src, 'rb') as f:
         pp = tomli.load(f)
     pp['project']['name'] = name
-    with open(src, 'wb') as f:
+    # Replace the file instead of overwriting it in-place, as it may be
+    # hardlinked to the original source tree.
+    with open(f'{src}.tmp', 'wb') as f:
         tomli_w.dump(pp, f)
+    os.replace(f'{src}.tmp', src)
 
 
 class _ControllerArgs(argparse.Namespace):
-    action: Literal['build', 'verify']
+    action: Literal['build', 'build-matrix', 'verify', 'plan']
     target: Literal['sdist', 'wheel-linux', 'wheel-win']
     cuda: str | None
-    python: str
+    python: list[str]
+    jobs: int | None
+    batch_python: bool
+    snapshot: SnapshotMode
+    compiler_cache: str | None
+    compiler_cache_size: int
+    build_cache: str | None
+    build_cache_size: int
+    mount_preloads: bool
+    opt_lib_cache: str | None
+    opt_lib_cache_size: int
+    size_baseline: str | None
+    recompress: bool
+    reproducible: bool
     dry_run: bool
     push: bool
     rmi: bool
+    log_dir: str | None
+    timing_history: str | None
     source: str | None
     output: str
-    dist: str | None
+    dist: list[str]
     test: list[str]
+    wheelhouse: str | None
+    offline: bool
+    pull_base: bool
+    test_shards: int
+    smoke_first: bool
+    history: str | None
+    verify_jobs: int
+    time_limit: int
+    plan_output: str | None
 
 
 class Controller:
@@ -152,21 +567,26 @@ class Controller:
         parser = argparse.ArgumentParser()
 
         parser.add_argument(
-            '--action', choices=['build', 'verify'], required=True,
+            '--action', choices=['build', 'build-matrix', 'verify', 'plan'],
+            required=True,
             help='action to perform')
 
         # Common options:
         parser.add_argument(
             '--target', choices=['sdist', 'wheel-linux', 'wheel-win'],
-            required=True,
-            help='build target')
+            help='build target (not used for build-matrix/plan)')
         parser.add_argument(
             '--cuda', type=str,
-            help='CUDA version for the wheel distribution')
+            help='CUDA version for the wheel distribution '
+                 '(for build-matrix/plan, limits the matrix to the version)')
         parser.add_argument(
             '--python', type=str, choices=WHEEL_PYTHON_VERSIONS.keys(),
-            required=True,
-            help='python version')
+            action='append', default=[],
+            help='python version; can be specified for multiple times to '
+                 'build wheels for Linux in a single container run, or to '
+                 'verify each --dist with its own version in a single '
+                 'container run on each system (for build-matrix/plan, '
+                 'limits the matrix to the versions)')
         parser.add_argument(
             '--dry-run', action='store_true', default=False,
             help='only generate builder/verifier Docker images - Linux only')
@@ -177,60 +597,252 @@ class Controller:
             '--rmi', action='store_true', default=False,
             help='remove builder/verifier Docker images after build '
                  '- Linux only')
+        parser.add_argument(
+            '--log-dir', type=str,
+            default=os.environ.get('CUPY_RELEASE_LOG_DIR', None),
+            help='path to the directory to write the full output of each '
+                 'command with timestamps (gzip-compressed) '
+                 '(default: $CUPY_RELEASE_LOG_DIR)')
+        parser.add_argument(
+            '--timing-history', type=str,
+            default=os.environ.get('CUPY_RELEASE_TIMING_HISTORY', None),
+            help='path to the SQLite database to record durations of steps '
+                 'to; see `dist_history.py` to query '
+                 '(default: $CUPY_RELEASE_TIMING_HISTORY)')
 
         # Build mode options:
         parser.add_argument(
             '--source', type=str,
             help='[build] path to the CuPy source tree; '
                  'must be a clean checkout')
+        parser.add_argument(
+            '--snapshot', choices=SNAPSHOT_MODES, default='auto',
+            help='[build] how to create the snapshot of the source tree in '
+                 'the working directory; only files tracked by git are '
+                 'included unless `copy` is specified (default: auto)')
+        parser.add_argument(
+            '--compiler-cache', type=str,
+            default=os.environ.get('CUPY_RELEASE_COMPILER_CACHE', None),
+            help='[build] path to the directory to persist compiler cache '
+                 '(ccache) among builds - Linux only '
+                 '(default: $CUPY_RELEASE_COMPILER_CACHE)')
+        parser.add_argument(
+            '--compiler-cache-size', type=int, default=20,
+            help='[build] maximum size of the compiler cache in GiB; '
+                 'least-recently-used caches are evicted (default: 20)')
+        parser.add_argument(
+            '--build-cache', type=str,
+            default=os.environ.get('CUPY_RELEASE_BUILD_CACHE', None),
+            help='[build] path to the directory to cache built assets; '
+                 'builds are skipped if the assets built from the same '
+                 'inputs are in the cache - Linux only '
+                 '(default: $CUPY_RELEASE_BUILD_CACHE)')
+        parser.add_argument(
+            '--build-cache-size', type=int, default=50,
+            help='[build] maximum size of the build cache in GiB; '
+                 'least-recently-used assets are evicted (default: 50)')
+        parser.add_argument(
+            '--mount-preloads', action='store_true', default=False,
+            help='[build] mount optional CUDA libraries (preloads) to the '
+                 'builder container at run time instead of installing them '
+                 'in the builder image - Linux only')
+        parser.add_argument(
+            '--opt-lib-cache', type=str,
+            default=os.environ.get('CUPY_RELEASE_OPT_LIB_CACHE', None),
+            help='[build] path to the directory to cache optional CUDA '
+                 'libraries (preloads) among builds '
+                 '(default: $CUPY_RELEASE_OPT_LIB_CACHE)')
+        parser.add_argument(
+            '--opt-lib-cache-size', type=int, default=10,
+            help='[build] maximum size of the optional CUDA library cache '
+                 'in GiB; least-recently-used libraries are evicted '
+                 '(default: 10)')
+        parser.add_argument(
+            '--size-baseline', type=str,
+            help='[build] path to the baseline wheel, its size report '
+                 '(`*.size.json`), or the directory containing them to '
+                 'compare sizes of built wheels with; defaults to the '
+                 'previous report in the output directory - Linux only')
+        parser.add_argument(
+            '--recompress', action='store_true', default=False,
+            help='[build] recompress built wheels with the highest '
+                 'compression level in parallel to reduce the size - '
+                 'Linux only')
+        parser.add_argument(
+            '--reproducible', action='store_true', default=False,
+            help='[build] set SOURCE_DATE_EPOCH to the commit time of the '
+                 'source tree and rewrite built wheels in a normalized '
+                 'layout so that builds are reproducible - Linux only')
         parser.add_argument(
             '--output', type=str, default='.',
             help='[build] path to the directory to place '
                  'the built distribution')
 
+        # Build-matrix mode options:
+        parser.add_argument(
+            '--jobs', type=int,
+            help='[build-matrix/verify/plan] number of builds '
+                 '(default: 2) or verifications on each system (default: 1) '
+                 'to run concurrently, or builds assumed to run concurrently '
+                 'for plan (default: 2) - Linux only')
+        parser.add_argument(
+            '--batch-python', action='store_true', default=False,
+            help='[build-matrix] build wheels for all Python versions in '
+                 'a single container run for each CUDA version')
+
         # Verify mode options:
         parser.add_argument(
-            '--dist', type=str,
-            help='[verify] path to the CuPy distribution (sdist or wheel)')
+            '--dist', type=str, action='append', default=[],
+            help='[verify] path to the CuPy distribution (sdist or wheel); '
+                 'can be specified for multiple times with the same number '
+                 'of --python - Linux only for multiple times')
         parser.add_argument(
             '--test', type=str, action='append', default=[],
             help='[verify] path to the directory containing CuPy unit tests '
                  '(can be specified for multiple times)')
+        parser.add_argument(
+            '--wheelhouse', type=str,
+            default=os.environ.get('CUPY_RELEASE_WHEELHOUSE', None),
+            help='[verify] path to the directory to keep wheels of '
+                 'dependencies and their pinned resolutions; the verifier '
+                 'installs packages from it - Linux only '
+                 '(default: $CUPY_RELEASE_WHEELHOUSE)')
+        parser.add_argument(
+            '--offline', action='store_true', default=False,
+            help='[verify] install packages only from the wheelhouse '
+                 'without accessing the package index')
+        parser.add_argument(
+            '--pull-base', action='store_true', default=False,
+            help='[build/build-matrix/verify] pull base images to detect '
+                 'their updates before creating builder/verifier images; '
+                 'locally present base images are used if pull fails - '
+                 'Linux only')
+        parser.add_argument(
+            '--test-shards', type=int, default=1,
+            help='[verify] number of processes to split tests into on each '
+                 'system, each pinned to its own GPU if several GPUs are '
+                 'visible; 0 to run one per GPU - Linux only (default: 1)')
+        parser.add_argument(
+            '--smoke-first', action='store_true', default=False,
+            help='[verify] run only installation and import checks on all '
+                 'systems concurrently before running tests on any system '
+                 '- Linux only')
 
-        return parser.parse_args(namespace=_ControllerArgs())
+        # Plan mode options:
+        parser.add_argument(
+            '--history', type=str,
+            help='[plan] path to the directory containing traces '
+                 '(`*.trace.json`) of previous runs to estimate durations of '
+                 'steps from (default: the output directory)')
+        parser.add_argument(
+            '--verify-jobs', type=int, default=1,
+            help='[plan] number of systems assumed to verify each '
+                 'distribution concurrently (`--jobs` of verify; default: 1)')
+        parser.add_argument(
+            '--time-limit', type=int, default=10800,
+            help='[plan] time limit of the release job in seconds '
+                 '(default: 10800)')
+        parser.add_argument(
+            '--plan-output', type=str,
+            help='[plan] path to export the plan as JSON, or Graphviz DOT '
+                 'if the path ends with `.dot`')
+
+        args = parser.parse_args(namespace=_ControllerArgs())
+        if args.action not in ('build-matrix', 'plan'):
+            if args.target is None:
+                parser.error(f'--target is required for {args.action}')
+            if len(args.python) == 0:
+                parser.error(f'--python is required for {args.action}')
+            multiple_python = (
+                (args.action == 'build' and args.target == 'wheel-linux') or
+                (args.action == 'verify' and args.target != 'wheel-win'))
+            if len(args.python) != 1 and not multiple_python:
+                parser.error(
+                    '--python can be specified for multiple times only for '
+                    'wheel-linux build or Linux verify')
+        if args.action == 'verify' and len(args.dist) != len(args.python):
+            parser.error('--dist must be specified for each --python')
+        if args.jobs is not None and args.jobs < 1:
+            parser.error('--jobs must be a positive integer')
+        if args.verify_jobs < 1:
+            parser.error('--verify-jobs must be a positive integer')
+        if args.test_shards < 0:
+            parser.error('--test-shards must be a non-negative integer')
+        if args.offline and args.wheelhouse is None:
+            parser.error('--offline requires --wheelhouse')
+        return args
 
     def main(self) -> None:
         args = self.parse_args()
+        set_command_log_dir(args.log_dir)
+        set_history_path(args.timing_history)
 
-        if args.action == 'build':
+        if args.action == 'build-matrix':
+            assert args.source is not None
+            # Log group will be emit for each build.
+            self.build_matrix(
+                args.cuda, args.python, args.source, args.output,
+                args.jobs or 2, args.batch_python, args.dry_run, args.push,
+                args.rmi, args.snapshot, args.compiler_cache,
+                args.compiler_cache_size, args.build_cache,
+                args.build_cache_size, args.mount_preloads,
+                args.opt_lib_cache, args.opt_lib_cache_size,
+                args.size_baseline, args.recompress, args.reproducible,
+                args.pull_base)
+        elif args.action == 'build':
             assert args.source is not None
             with log_group('Build'):
                 if args.target == 'wheel-win':
                     assert args.cuda is not None, 'CUDA version unspecified'
                     self.build_windows(
-                        args.target, args.cuda, args.python,
-                        args.source, args.output)
+                        args.target, args.cuda, args.python[0],
+                        args.source, args.output, args.snapshot,
+                        args.opt_lib_cache, args.opt_lib_cache_size)
                 else:
                     # For sdist build, args.cuda can be None.
                     self.build_linux(
                         args.target, args.cuda, args.python,
                         args.source, args.output, args.dry_run, args.push,
-                        args.rmi)
+                        args.rmi, snapshot=args.snapshot,
+                        compiler_cache=args.compiler_cache,
+                        compiler_cache_size=args.compiler_cache_size,
+                        build_cache=args.build_cache,
+                        build_cache_size=args.build_cache_size,
+                        mount_preloads=args.mount_preloads,
+                        opt_lib_cache=args.opt_lib_cache,
+                        opt_lib_cache_size=args.opt_lib_cache_size,
+                        size_baseline=args.size_baseline,
+                        recompress=args.recompress,
+                        reproducible=args.reproducible,
+                        pull_base=args.pull_base)
+        elif args.action == 'plan':
+            with log_group('Plan'):
+                self.plan(
+                    args.cuda, args.python, args.jobs or 2, args.verify_jobs,
+                    args.history or args.output, args.time_limit,
+                    args.plan_output)
         elif args.action == 'verify':
-            assert args.dist is not None
-            if args.target == 'wheel-win':
-                assert args.cuda is not None, 'CUDA version unspecified'
-                with log_group('Verify'):
-                    self.verify_windows(
+            try:
+                if args.target == 'wheel-win':
+                    assert args.cuda is not None, 'CUDA version unspecified'
+                    with log_group('Verify'):
+                        self.verify_windows(
+                            args.target, args.cuda, args.python[0],
+                            args.dist[0], args.test)
+                else:
+                    # Log group will be emit for each verification run.
+                    # For sdist verify, args.cuda can be None.
+                    self.verify_linux(
                         args.target, args.cuda, args.python,
-                        args.dist, args.test)
-            else:
-                # Log group will be emit for each verification run.
-                # For sdist verify, args.cuda can be None.
-                self.verify_linux(
-                    args.target, args.cuda, args.python,
-                    args.dist, args.test, args.dry_run, args.push,
-                    args.rmi)
+                        args.dist, args.test, args.dry_run, args.push,
+                        args.rmi, args.jobs or 1, args.wheelhouse,
+                        args.offline, args.test_shards, args.smoke_first,
+                        args.pull_base)
+            finally:
+                for dist in args.dist:
+                    trace_path = f'{dist}.verify.trace.json'
+                    log(f'Writing trace to: {trace_path}')
+                    write_trace(trace_path)
 
     @staticmethod
     def _create_builder_linux(
@@ -240,26 +852,18 @@ class Controller:
         system_packages: str,
         docker_ctx: str,
         push: bool,
+        pull_base: bool = False,
     ) -> None:
         """Create a docker image to build distributions."""
 
         python_versions = ' '.join(
             [x['pyenv'] for x in WHEEL_PYTHON_VERSIONS.values()])
-        log(f'Building Docker image: {image_tag}')
-        run_command(
-            'docker', 'build',
-            '--file', f'{docker_ctx}/{builder_dockerfile}',
-            '--tag', image_tag,
-            '--cache-from', image_tag,
-            '--build-arg', 'BUILDKIT_INLINE_CACHE=1',
-            '--build-arg', f'base_image={base_image}',
-            '--build-arg', f'python_versions={python_versions}',
-            '--build-arg', f'system_packages={system_packages}',
-            docker_ctx,
-            extra_env={'DOCKER_BUILDKIT': '1'},
-        )
-        if push:
-            run_command('docker', 'push', image_tag)
+        Controller._build_image(
+            image_tag, docker_ctx, builder_dockerfile, {
+                'base_image': base_image,
+                'python_versions': python_versions,
+                'system_packages': system_packages,
+            }, push, pull_base)
 
     @staticmethod
     def _create_verifier_linux(
@@ -268,6 +872,7 @@ class Controller:
         system_packages: str,
         docker_ctx: str,
         push: bool,
+        pull_base: bool = False,
     ) -> None:
         """Create a docker image to verify distributions."""
 
@@ -292,18 +897,90 @@ class Controller:
 
         python_versions = ' '.join(
             [x['pyenv'] for x in WHEEL_PYTHON_VERSIONS.values()])
-        log(f'Building Docker image: {image_tag}')
-        run_command(
-            'docker', 'build',
-            '--tag', image_tag,
-            '--cache-from', image_tag,
-            '--build-arg', 'BUILDKIT_INLINE_CACHE=1',
-            '--build-arg', f'base_image={base_image}',
-            '--build-arg', f'python_versions={python_versions}',
-            '--build-arg', f'system_packages={system_packages}',
-            docker_ctx,
-            extra_env={'DOCKER_BUILDKIT': '1'},
-        )
+        Controller._build_image(
+            image_tag, docker_ctx, 'Dockerfile', {
+                'base_image': base_image,
+                'python_versions': python_versions,
+                'system_packages': system_packages,
+            }, push, pull_base)
+
+    @staticmethod
+    def _get_image_fingerprint(image_tag: str) -> str | None:
+        """Returns the fingerprint label of the image if exists."""
+        try:
+            label = run_command_output(
+                'docker', 'image', 'inspect',
+                '--format',
+                f'{{{{ index .Config.Labels "{_IMAGE_FINGERPRINT_LABEL}" }}}}',
+                image_tag)
+        except subprocess.CalledProcessError:
+            # No such image.
+            return None
+        label = label.strip()
+        return label if label not in ('', '<no value>') else None
+
+    @staticmethod
+    def _get_image_id(image: str) -> str | None:
+        """Returns the ID of the image if exists locally."""
+        try:
+            image_id = run_command_output(
+                'docker', 'image', 'inspect', '--format', '{{.Id}}', image)
+        except subprocess.CalledProcessError:
+            # No such image.
+            return None
+        return image_id.strip()
+
+    @staticmethod
+    def _build_image(
+        image_tag: str,
+        docker_ctx: str,
+        dockerfile: str,
+        build_args: Mapping[str, str],
+        push: bool,
+        pull_base: bool = False,
+    ) -> None:
+        """Build a docker image unless it is up-to-date.
+
+        The fingerprint of the image, computed from contents of the context,
+        build arguments and the ID of the locally present base image, is
+        recorded as a label of the image.  The build is skipped if the image
+        with the same fingerprint already exists.  If `pull_base` is True,
+        the base image (`base_image` build argument) is pulled first so that
+        updates of the base image under the same name are detected; failure
+        to pull is not fatal and the local base image is used instead.
+        """
+        base_image = build_args['base_image']
+        if pull_base:
+            try:
+                run_command('docker', 'pull', base_image)
+            except (subprocess.CalledProcessError, OSError) as e:
+                log(f'WARNING: failed to pull {base_image}, '
+                    f'using the local image: {e}')
+        base_image_id = Controller._get_image_id(base_image)
+        log(f'Base image: {base_image} ({base_image_id})')
+        fingerprint = cache_key(
+            tree_digest(docker_ctx), dockerfile,
+            *(f'{k}={v}' for k, v in sorted(build_args.items())),
+            f'base_image_id={base_image_id or ""}')
+        if Controller._get_image_fingerprint(image_tag) == fingerprint:
+            log(f'Docker image is up-to-date: {image_tag} ({fingerprint})')
+        else:
+            log(f'Building Docker image: {image_tag} ({fingerprint})')
+            build_arg_options = []
+            for k, v in build_args.items():
+                build_arg_options += ['--build-arg', f'{k}={v}']
+            with history_step('image', image_tag):
+                run_command(
+                    'docker', 'build',
+                    '--file', f'{docker_ctx}/{dockerfile}',
+                    '--tag', image_tag,
+                    '--cache-from', image_tag,
+                    '--label', f'{_IMAGE_FINGERPRINT_LABEL}={fingerprint}',
+                    '--build-arg', 'BUILDKIT_INLINE_CACHE=1',
+                    *build_arg_options,
+                    docker_ctx,
+                    extra_env={'DOCKER_BUILDKIT': '1'},
+                )
         if push:
             run_command('docker', 'push', image_tag)
 
@@ -320,7 +997,17 @@ class Controller:
         *,
         require_runtime: bool = True,
         docker_opts: list[str] | None = None,
+        compiler_cache: str | None = None,
+        compiler_cache_size: int = 0,
+        trace: str | None = None,
     ) -> None:
+        """Runs the container.
+
+        If `trace` is given, the agent in the container is requested to
+        record the trace, which is merged as a process named `trace`.  The
+        peak memory usage and pytest runs recorded in the trace are also
+        recorded to the timing history (see `dist_history.py`).
+        """
         assert kind in {'cuda', 'rocm'}
 
         log(f'Running docker container with image: {image_tag} ({kind})')
@@ -343,6 +1030,17 @@ class Controller:
                 ]
                 if video_group != '':
                     docker_run += ['--group-add', video_group]
+        if compiler_cache is not None:
+            # See `builder/build-wrapper` for how the cache is used.
+            log(f'Using compiler cache: {compiler_cache} '
+                f'(max {compiler_cache_size} GiB)')
+            docker_run += [
+                '--volume', f'{compiler_cache}:/ccache',
+                '--env', 'CCACHE_DIR=/ccache',
+                '--env', f'CCACHE_MAXSIZE={compiler_cache_size}G',
+            ]
+        if trace is not None:
+            agent_args = ['--trace', '/work/agent.trace.json', *agent_args]
         command = (
             docker_run
             + (docker_opts if docker_opts is not None else [])
@@ -356,7 +1054,24 @@ class Controller:
             ]
             + agent_args
         )
-        run_command(*command)
+        try:
+            run_command(*command)
+        finally:
+            if trace is not None:
+                for event in merge_trace(
+                        f'{workdir}/agent.trace.json', trace):
+                    event_args = event.get('args', {})
+                    memory_peak = event_args.get('memory_peak_kib')
+                    if memory_peak is None:
+                        # Not running in a container (cgroup unavailable).
+                        memory_peak = event_args.get('max_rss_kib')
+                    if memory_peak is not None:
+                        note_max_rss(memory_peak)
+                    if (event.get('cat') == 'command' and
+                            ' -m pytest' in event['name']):
+                        record_sub_step(
+                            'pytest', event['ts'] / 1e6, event['dur'] / 1e6,
+                            event_args.get('exit_code', 1), memory_peak)
 
     @staticmethod
     def _ensure_compatible_branch(version: str) -> None:
@@ -367,92 +1082,299 @@ class Controller:
                 f'but your source tree is CuPy v{version}.'
             )
 
+    @staticmethod
+    def _builder_image_tag(target: str, cuda_version: str | None) -> str:
+        if target == 'wheel-linux':
+            return ('cupy/cupy-release-tools:builder-'
+                    f'{cuda_version}-v{CUPY_MAJOR_VERSION}')
+        elif target == 'sdist':
+            return ('cupy/cupy-release-tools:builder-'
+                    f'sdist-v{CUPY_MAJOR_VERSION}')
+        raise RuntimeError('unknown target')
+
+    @staticmethod
+    def _long_description(cuda_version: str | None) -> str:
+        """Returns the long description of the distribution."""
+        if cuda_version is None:
+            return SDIST_LONG_DESCRIPTION
+        kind = WHEEL_LINUX_CONFIGS[cuda_version]['kind']
+        platform_version = WHEEL_LINUX_CONFIGS[cuda_version].get(
+            'platform_version', cuda_version)
+        if kind == 'cuda':
+            return WHEEL_LONG_DESCRIPTION_CUDA.format(
+                version=platform_version,
+                wheel_suffix=''.join(platform_version.split('.')))
+        elif kind == 'rocm':
+            return WHEEL_LONG_DESCRIPTION_ROCM.format(
+                version=platform_version)
+        raise AssertionError('Unreachable')
+
+    @staticmethod
+    def _linux_assets(
+        cuda_version: str | None, version: str, python_versions: Sequence[str]
+    ) -> list[tuple[str, str]]:
+        """Returns names of assets as built and as renamed to output."""
+        if cuda_version is None:
+            # Rename not needed for sdist.
+            asset_name = sdist_name('cupy', version)
+            return [(asset_name, asset_name)]
+
+        # Rename wheels to manylinux.
+        package_name = WHEEL_LINUX_CONFIGS[cuda_version]['name']
+        arch = WHEEL_LINUX_CONFIGS[cuda_version].get('arch', 'x86_64')
+        return [
+            (
+                wheel_name(
+                    package_name, version, python_version,
+                    wheel_linux_platform_tag(arch, False)),
+                wheel_name(
+                    package_name, version, python_version,
+                    wheel_linux_platform_tag(arch, True)),
+            )
+            for python_version in python_versions
+        ]
+
+    def _setup_builder_linux(
+        self,
+        target: str,
+        cuda_version: str | None,
+        source: str,
+        workdir: str,
+        push: bool,
+        mount_preloads: bool = False,
+        opt_lib_cache: str | None = None,
+        opt_lib_cache_size: int = 10,
+        pull_base: bool = False,
+    ) -> str:
+        """Create a docker image to build distributions for the target.
+
+        Optional CUDA libraries are extracted under `workdir` as a part of
+        the docker build context, unless `mount_preloads` is True (see
+        `build_linux`).  Returns the tag of the image.
+        """
+
+        image_tag = self._builder_image_tag(target, cuda_version)
+        if target == 'wheel-linux':
+            assert cuda_version is not None
+            config = WHEEL_LINUX_CONFIGS[cuda_version]
+            kind = config['kind']
+            arch: str | None = config.get('arch', 'x86_64')
+            preloads = config['preloads']
+            preloads_cuda_version: str | None = config.get(
+                'preloads_cuda_version', cuda_version)
+            base_image = config['image']
+            builder_dockerfile = config.get('builder_dockerfile', 'Dockerfile')
+            system_packages = config['system_packages']
+        elif target == 'sdist':
+            assert cuda_version is None
+            kind = 'cuda'
+            arch = None
+            preloads = []
+            preloads_cuda_version = None
+            base_image = SDIST_CONFIG['image']
+            builder_dockerfile = 'Dockerfile'
+            system_packages = ''
+        else:
+            raise RuntimeError('unknown target')
+
+        # Copy builder directory to working directory.
+        docker_ctx = f'{workdir}/builder'
+        log(f'Copying builder directory to: {docker_ctx}')
+        shutil.copytree('builder/', docker_ctx)
+        for f in _SHARED_CONTEXT_FILES:
+            shutil.copy2(f, docker_ctx)
+
+        # Extract optional CUDA libraries.
+        optlib_workdir = f'{docker_ctx}/cuda_lib'
+        log('Creating CUDA optional lib directory under '
+            f'builder directory: {optlib_workdir}')
+        os.mkdir(optlib_workdir)
+        if mount_preloads:
+            # Keep the directory empty so that the image does not depend on
+            # versions of optional CUDA libraries.
+            log('Optional CUDA libraries will be installed at run time')
+            preloads = []
+        if 0 < len(preloads):
+            assert preloads_cuda_version is not None
+            assert arch is not None
+            install_cuda_opt_libraries(
+                preloads, preloads_cuda_version, arch, optlib_workdir,
+                source=source, workdir=workdir, cache=opt_lib_cache,
+                cache_size=opt_lib_cache_size)
+
+        # Enable QEMU for cross-compilation.
+        if arch is not None and arch != platform.uname().machine:
+            log('Cross-build requested, registering binfmt interpreter')
+            self._run_container(
+                'multiarch/qemu-user-static', kind, workdir,
+                ['--reset', '-p', 'yes'],
+                require_runtime=False,
+                docker_opts=['--privileged'],
+            )
+
+        # Creates a Docker image to build distribution.
+        self._create_builder_linux(
+            image_tag, base_image, builder_dockerfile, system_packages,
+            docker_ctx, push, pull_base)
+        return image_tag
+
     def build_linux(
         self,
         target: str,
         cuda_version: str | None,
-        python_version: str,
+        python_versions: Sequence[str],
         source: str,
         output: str,
         dry_run: bool,
         push: bool,
         rmi: bool,
+        *,
+        image_ready: bool = False,
+        snapshot: SnapshotMode = 'auto',
+        compiler_cache: str | None = None,
+        compiler_cache_size: int = 20,
+        evict_compiler_cache: bool = True,
+        build_cache: str | None = None,
+        build_cache_size: int = 50,
+        source_fingerprint: str | None = None,
+        mount_preloads: bool = False,
+        opt_lib_cache: str | None = None,
+        opt_lib_cache_size: int = 10,
+        size_baseline: str | None = None,
+        recompress: bool = False,
+        reproducible: bool = False,
+        rewrite_jobs: int | None = None,
+        trace: bool = True,
+        pull_base: bool = False,
     ) -> None:
-        """Build a single wheel distribution for Linux."""
+        """Build distributions for Linux.
+
+        Wheels for all the given Python versions are built in a single
+        container run.  If `image_ready` is True, the builder image is assumed
+        to be already created by `_setup_builder_linux`.  If `trace` is True,
+        the trace is written next to each asset (`*.build.trace.json`).
+
+        If `compiler_cache` is given, the compiler cache for the build config
+        is mounted to the container.  Least-recently-used caches of other
+        configs are evicted before the build unless `evict_compiler_cache`
+        is False (see `build_matrix`).
+
+        If `build_cache` is given, assets found in the cache are copied from
+        it instead of being built (see `_build_fingerprint`), and built
+        assets are stored to it.  `source_fingerprint` can be given to avoid
+        computing the fingerprint of the source tree for each build.
+
+        If `mount_preloads` is True, optional CUDA libraries are extracted to
+        the working directory and installed by the agent when the container
+        starts, so that the builder image can be shared among versions of
+        the libraries.
+
+        If `reproducible` is True, `SOURCE_DATE_EPOCH` is set to the commit
+        time of the source tree, and wheels are rewritten in a normalized
+        layout (see `_rewrite_wheel`).  If `recompress` is True, wheels are
+        rewritten with the highest compression level to reduce the size.
+        Wheels are rewritten with `rewrite_jobs` processes (default: the
+        number of CPUs).  SHA256 digests of assets are recorded next to them
+        (`*.sha256`).  Sizes of
+        wheels, including those found in the build cache, are reported (see
+        `_report_wheel_size`) and compared with `size_baseline`.
+        """
 
         version = get_version_from_source_tree(source)
         self._ensure_compatible_branch(version)
 
+        image_tag = self._builder_image_tag(target, cuda_version)
         if target == 'wheel-linux':
             assert cuda_version is not None
             log(
                 f'Starting wheel-linux build from {source} '
                 f'(version {version}, for CUDA {cuda_version} '
-                f'+ Python {python_version})'
+                f'+ Python {", ".join(python_versions)})'
             )
             action = 'wheel'
-            image_tag = ('cupy/cupy-release-tools:builder-'
-                         f'{cuda_version}-v{CUPY_MAJOR_VERSION}')
             kind = WHEEL_LINUX_CONFIGS[cuda_version]['kind']
             arch = WHEEL_LINUX_CONFIGS[cuda_version].get('arch', 'x86_64')
             preloads = WHEEL_LINUX_CONFIGS[cuda_version]['preloads']
             preloads_cuda_version = WHEEL_LINUX_CONFIGS[cuda_version].get(
                 'preloads_cuda_version', cuda_version)
-            platform_version = WHEEL_LINUX_CONFIGS[cuda_version].get(
-                'platform_version', cuda_version)
-            base_image = WHEEL_LINUX_CONFIGS[cuda_version]['image']
-            builder_dockerfile = WHEEL_LINUX_CONFIGS[cuda_version].get(
-                'builder_dockerfile', 'Dockerfile')
             package_name = WHEEL_LINUX_CONFIGS[cuda_version]['name']
-            system_packages = \
-                WHEEL_LINUX_CONFIGS[cuda_version]['system_packages']
-
-            if kind == 'cuda':
-                long_description = WHEEL_LONG_DESCRIPTION_CUDA.format(
-                    version=platform_version,
-                    wheel_suffix=''.join(platform_version.split('.')))
-            elif kind == 'rocm':
-                long_description = WHEEL_LONG_DESCRIPTION_ROCM.format(
-                    version=platform_version)
-            else:
-                raise AssertionError('Unreachable')
-
-            # Rename wheels to manylinux.
-            asset_name = wheel_name(
-                package_name, version, python_version,
-                wheel_linux_platform_tag(arch, False))
-            asset_dest_name = wheel_name(
-                package_name, version, python_version,
-                wheel_linux_platform_tag(arch, True))
         elif target == 'sdist':
             assert cuda_version is None
+            assert len(python_versions) == 1
             log(f'Starting sdist build from {source} (version {version})')
             action = 'sdist'
-            image_tag = ('cupy/cupy-release-tools:builder-'
-                         f'sdist-v{CUPY_MAJOR_VERSION}')
             kind = 'cuda'
-            arch = None
             preloads = []
             preloads_cuda_version = None
-            base_image = SDIST_CONFIG['image']
-            builder_dockerfile = 'Dockerfile'
             package_name = 'cupy'
-            system_packages = ''
-            long_description = SDIST_LONG_DESCRIPTION
-
-            # Rename not needed for sdist.
-            asset_name = sdist_name('cupy', version)
-            asset_dest_name = asset_name
         else:
             raise RuntimeError('unknown target')
+        long_description = self._long_description(cuda_version)
+        assets = self._linux_assets(cuda_version, version, python_versions)
+
+        source_date_epoch = None
+        if reproducible:
+            source_date_epoch = get_source_date_epoch(source)
+            if source_date_epoch is None:
+                log('WARNING: source tree is not a git working tree; '
+                    'SOURCE_DATE_EPOCH is not set')
+            else:
+                log(f'Using SOURCE_DATE_EPOCH: {source_date_epoch}')
+
+        # Look up the build cache.
+        fingerprints: dict[str, str] = {}
+        if build_cache is not None and not dry_run:
+            build_cache = os.path.abspath(build_cache)
+            os.makedirs(build_cache, exist_ok=True)
+            if source_fingerprint is None:
+                log(f'Computing fingerprint of source tree: {source}')
+                source_fingerprint = fingerprint_source_tree(source, snapshot)
+            missing = []
+            for python_version, (_, asset_dest_name) in zip(
+                    python_versions, assets):
+                fingerprint = self._build_fingerprint(
+                    target, cuda_version, python_version, source_fingerprint,
+                    long_description, recompress, reproducible,
+                    source_date_epoch)
+                fingerprints[python_version] = fingerprint
+                entry = f'{build_cache}/{fingerprint}'
+                if not os.path.exists(f'{entry}/{asset_dest_name}'):
+                    log(f'Build cache miss: {asset_dest_name} ({fingerprint})')
+                    missing.append(python_version)
+                    continue
+                output_path = f'{output}/{asset_dest_name}'
+                if target == 'wheel-linux':
+                    # The size budget is not a part of the fingerprint;
+                    # check cached wheels as well.
+                    assert cuda_version is not None
+                    self._report_wheel_size(
+                        f'{entry}/{asset_dest_name}', output_path,
+                        cuda_version, size_baseline)
+                log(f'Build cache hit: copying asset from {entry} to '
+                    f'{output_path}')
+                shutil.copy2(f'{entry}/{asset_dest_name}', output_path)
+                self._record_digest(output_path)
+                touch(entry)
+            if len(missing) == 0:
+                log('All assets found in build cache, skipping build')
+                return
+            assets = [
+                asset for python_version, asset in zip(python_versions, assets)
+                if python_version in missing
+            ]
+            python_versions = missing
 
         # Arguments for the agent.
         agent_args = [
             '--action', action,
             '--source', 'cupy',
-            '--python', WHEEL_PYTHON_VERSIONS[python_version]['pyenv'],
             '--chown', f'{os.getuid()}:{os.getgid()}',
         ]
+        for python_version in python_versions:
+            agent_args += [
+                '--python', WHEEL_PYTHON_VERSIONS[python_version]['pyenv']]
+        if mount_preloads and 0 < len(preloads):
+            agent_args += ['--cuda-opt-lib', 'cuda_lib']
 
         # Environmental variables to pass to builder
         setup_args = [
@@ -468,6 +1390,8 @@ class Controller:
             ]
         elif target == 'sdist':
             setup_args += ['--env', 'CUPY_INSTALL_USE_STUB=1']
+        if source_date_epoch is not None:
+            setup_args += ['--env', f'SOURCE_DATE_EPOCH={source_date_epoch}']
         agent_args += setup_args
 
         # Create a working directory.
@@ -476,9 +1400,8 @@ class Controller:
         try:
             log(f'Using working directory: {workdir}')
 
-            # Copy source tree to working directory.
-            log(f'Copying source tree from: {source}')
-            shutil.copytree(source, f'{workdir}/cupy', symlinks=True)
+            # Create a snapshot of the source tree in working directory.
+            snapshot_source(source, f'{workdir}/cupy', snapshot)
 
             # Rename project name
             rename_project(f'{workdir}/cupy/pyproject.toml', package_name)
@@ -489,23 +1412,6 @@ class Controller:
             ) as f:
                 f.write(long_description)
 
-            # Copy builder directory to working directory.
-            docker_ctx = f'{workdir}/builder'
-            log(f'Copying builder directory to: {docker_ctx}')
-            shutil.copytree('builder/', docker_ctx)
-
-            # Extract optional CUDA libraries.
-            optlib_workdir = f'{docker_ctx}/cuda_lib'
-            log('Creating CUDA optional lib directory under '
-                f'builder directory: {optlib_workdir}')
-            os.mkdir(optlib_workdir)
-            for p in preloads:
-                assert preloads_cuda_version is not None
-                assert arch is not None
-                install_cuda_opt_library(
-                    p, preloads_cuda_version, arch, optlib_workdir,
-                    workdir=workdir)
-
             # Create a wheel metadata file for preload.
             if target == 'wheel-linux':
                 assert preloads_cuda_version is not None
@@ -517,37 +1423,105 @@ class Controller:
                 ) as f:
                     json.dump(wheel_metadata, f)
 
-            # Enable QEMU for cross-compilation.
-            if arch is not None and arch != platform.uname().machine:
-                log('Cross-build requested, registering binfmt interpreter')
-                self._run_container(
-                    'multiarch/qemu-user-static', kind, workdir,
-                    ['--reset', '-p', 'yes'],
-                    require_runtime=False,
-                    docker_opts=['--privileged'],
-                )
+            # Extract optional CUDA libraries to be installed at run time.
+            if mount_preloads and 0 < len(preloads):
+                assert preloads_cuda_version is not None
+                optlib_workdir = f'{workdir}/cuda_lib'
+                os.mkdir(optlib_workdir)
+                install_cuda_opt_libraries(
+                    preloads, preloads_cuda_version, arch, optlib_workdir,
+                    source='cupy', workdir=workdir, cache=opt_lib_cache,
+                    cache_size=opt_lib_cache_size)
 
             # Creates a Docker image to build distribution.
-            self._create_builder_linux(
-                image_tag, base_image, builder_dockerfile, system_packages,
-                docker_ctx, push)
+            if not image_ready:
+                self._setup_builder_linux(
+                    target, cuda_version, 'cupy', workdir, push,
+                    mount_preloads, opt_lib_cache, opt_lib_cache_size,
+                    pull_base)
 
             if dry_run:
                 log('Dry run requested, exiting without actual build.')
                 return
 
+            # Prepare compiler cache.
+            cache_dir = None
+            if compiler_cache is not None:
+                base_image = (
+                    SDIST_CONFIG['image'] if cuda_version is None
+                    else WHEEL_LINUX_CONFIGS[cuda_version]['image'])
+                compiler_cache = os.path.abspath(compiler_cache)
+                os.makedirs(compiler_cache, exist_ok=True)
+                cache_dir = compiler_cache_dir(
+                    compiler_cache, cuda_version or 'sdist', base_image)
+                if evict_compiler_cache:
+                    for name in evict_lru(
+                            compiler_cache, compiler_cache_size * 1024 ** 3,
+                            keep=[os.path.basename(cache_dir)]):
+                        log(f'Evicted compiler cache: {name}')
+
             # Build.
             log('Starting build')
-            self._run_container(
-                image_tag, kind, workdir, agent_args,
-                require_runtime=False)
+            with history_step('build', cuda_version or 'sdist',
+                              ','.join(python_versions)):
+                self._run_container(
+                    image_tag, kind, workdir, agent_args,
+                    require_runtime=False,
+                    compiler_cache=cache_dir,
+                    compiler_cache_size=compiler_cache_size,
+                    trace=f'builder ({image_tag})')
             log('Finished build')
 
-            # Copy assets.
-            asset_path = f'{workdir}/cupy/dist/{asset_name}'
-            output_path = f'{output}/{asset_dest_name}'
-            log(f'Copying asset from {asset_path} to {output_path}')
-            shutil.copy2(asset_path, output_path)
+            # Check assets, and rewrite wheels reproducibly and/or
+            # recompress them.
+            for asset_name, _ in assets:
+                asset_path = f'{workdir}/cupy/dist/{asset_name}'
+                self._check_asset(asset_path, asset_name)
+                if target == 'wheel-linux' and (reproducible or recompress):
+                    self._rewrite_wheel(
+                        asset_path, asset_name, source_date_epoch,
+                        recompress, rewrite_jobs or os.cpu_count() or 1)
+
+            # Report sizes of wheels and check the budget before copying.
+            if target == 'wheel-linux':
+                assert cuda_version is not None
+                for asset_name, asset_dest_name in assets:
+                    self._report_wheel_size(
+                        f'{workdir}/cupy/dist/{asset_name}',
+                        f'{output}/{asset_dest_name}', cuda_version,
+                        size_baseline)
+
+            # Copy assets and record digests.
+            for asset_name, asset_dest_name in assets:
+                asset_path = f'{workdir}/cupy/dist/{asset_name}'
+                output_path = f'{output}/{asset_dest_name}'
+                log(f'Copying asset from {asset_path} to {output_path}')
+                shutil.copy2(asset_path, output_path)
+                self._record_digest(output_path)
+
+            # Store assets to the build cache.
+            if build_cache is not None:
+                entries = []
+                for python_version, (_, asset_dest_name) in zip(
+                        python_versions, assets):
+                    entry = f'{build_cache}/{fingerprints[python_version]}'
+                    log(f'Storing asset to build cache: {entry}')
+                    # Populate in a temporary directory first as the cache may
+                    # be shared among concurrent builds.
+                    tmpdir = tempfile.mkdtemp(prefix='.tmp-', dir=build_cache)
+                    shutil.copy2(
+                        f'{output}/{asset_dest_name}',
+                        f'{tmpdir}/{asset_dest_name}')
+                    try:
+                        os.rename(tmpdir, entry)
+                    except OSError:
+                        # Stored by another build.
+                        shutil.rmtree(tmpdir)
+                    entries.append(os.path.basename(entry))
+                for name in evict_lru(
+                        build_cache, build_cache_size * 1024 ** 3,
+                        keep=entries):
+                    log(f'Evicted build cache: {name}')
 
             # Remove Docker image.
             if rmi:
@@ -557,6 +1531,474 @@ class Controller:
         finally:
             log(f'Removing working directory: {workdir}')
             shutil.rmtree(workdir)
+            if trace:
+                for _, asset_dest_name in assets:
+                    trace_path = f'{output}/{asset_dest_name}.build.trace.json'
+                    log(f'Writing trace to: {trace_path}')
+                    write_trace(trace_path)
+
+    @staticmethod
+    def _check_asset(asset_path: str, asset_name: str) -> None:
+        """Checks the built asset before it is verified.
+
+        Wheels are checked against their RECORD and `asset_name` (the name
+        before renamed to manylinux), and the long description is rendered
+        as `twine check --strict` does.
+        """
+        log(f'Checking asset: {asset_path}')
+        with trace_span('check', 'check', asset=asset_name):
+            check_dist(asset_path, asset_name)
+
+    @staticmethod
+    def _rewrite_wheel(
+        wheel_path: str,
+        asset_name: str,
+        source_date_epoch: int | None,
+        recompress: bool,
+        jobs: int,
+    ) -> None:
+        """Rewrites the wheel in a normalized layout and checks it again.
+
+        Members are sorted, and their timestamps are set to
+        `source_date_epoch` (if given) so that the wheel is reproducible.
+        Members are compressed in parallel by `jobs` processes with the
+        highest compression level if `recompress` is True, or the default
+        level otherwise.
+        """
+        level = 9 if recompress else 6
+        log(f'Rewriting wheel with {jobs} process(es) '
+            f'(compression level {level}): {wheel_path}')
+        size = os.path.getsize(wheel_path)
+        with trace_span('rewrite', 'check', asset=asset_name) as span:
+            saved = rewrite_wheel(
+                wheel_path, jobs, level, source_date_epoch)
+            span['saved'] = saved
+        log(f'Rewrote wheel: saved {saved / 1024 ** 2:.2f} MiB '
+            f'({saved / size:.1%})')
+        Controller._check_asset(wheel_path, asset_name)
+
+    @staticmethod
+    def _record_digest(asset_path: str) -> None:
+        """Records the SHA256 digest of the asset (`*.sha256`)."""
+        digest = file_sha256(asset_path)
+        log(f'SHA256: {digest} {os.path.basename(asset_path)}')
+        with open(f'{asset_path}.sha256', 'w', encoding='UTF-8') as f:
+            f.write(f'{digest}  {os.path.basename(asset_path)}\n')
+
+    @staticmethod
+    def _report_wheel_size(
+        wheel_path: str,
+        output_path: str,
+        cuda_version: str,
+        size_baseline: str | None,
+    ) -> None:
+        """Reports sizes of the wheel and checks the size budget.
+
+        The wheel is checked before it is copied to `output_path`, next to
+        which the report is written (`*.size.json`).  The report is compared
+        with the baseline, which is a wheel, a size report, or a directory
+        containing either of them for the same project, Python tag and
+        platform tag (see `find_size_baseline`).  If the baseline is not
+        given, the report previously written is used.
+        """
+        wheel_basename = os.path.basename(output_path)
+        report = wheel_size_report(wheel_path, wheel_basename)
+        report_path = f'{output_path}.size.json'
+        candidates: list[str | None]
+        if size_baseline is None:
+            candidates = [report_path]
+        elif os.path.isdir(size_baseline):
+            candidates = [find_size_baseline(size_baseline, wheel_basename)]
+        else:
+            candidates = [size_baseline]
+        baseline = None
+        for path in candidates:
+            if path is None or not os.path.exists(path):
+                continue
+            log(f'Comparing wheel size with baseline: {path}')
+            if path.endswith('.whl'):
+                baseline = wheel_size_report(path)
+            else:
+                with open(path, encoding='UTF-8') as f:
+                    baseline = json.load(f)
+            break
+        else:
+            if size_baseline is not None:
+                raise RuntimeError(f'Baseline not found: {size_baseline}')
+
+        for line in format_size_report(report, baseline):
+            log(line)
+        log(f'Writing size report to: {report_path}')
+        with open(f'{report_path}.tmp', 'w', encoding='UTF-8') as f:
+            json.dump(report, f, indent=1, sort_keys=True)
+        os.replace(f'{report_path}.tmp', report_path)
+
+        budget = WHEEL_LINUX_CONFIGS[cuda_version].get('size_budget')
+        if budget is not None and budget * 1024 ** 2 < report['size']:
+            raise RuntimeError(
+                f'Wheel size exceeds the budget of {budget} MiB: '
+                f'{wheel_basename} ({report["size"] / 1024 ** 2:.2f} MiB)')
+
+    @staticmethod
+    def _build_fingerprint(
+        target: str,
+        cuda_version: str | None,
+        python_version: str,
+        source_fingerprint: str,
+        long_description: str,
+        recompress: bool = False,
+        reproducible: bool = False,
+        source_date_epoch: int | None = None,
+    ) -> str:
+        """Returns a fingerprint of inputs of the build.
+
+        The fingerprint covers the source tree (including versions of
+        preload libraries defined in it), the build config and the Python
+        config, the builder directory, the long description, whether wheels
+        are recompressed or rewritten reproducibly, and `SOURCE_DATE_EPOCH`.
+        Configs only used for verification or checks of the built assets are
+        excluded.
+        """
+        config: Mapping[str, Any] = (
+            SDIST_CONFIG if cuda_version is None
+            else WHEEL_LINUX_CONFIGS[cuda_version])
+        parts = [
+            target,
+            cuda_version or '',
+            json.dumps({
+                k: v for k, v in config.items()
+                if not k.startswith('verify_') and k != 'size_budget'
+            }, sort_keys=True),
+            tree_digest(os.path.join(
+                os.path.dirname(os.path.abspath(__file__)), 'builder')),
+            tree_digest(
+                os.path.dirname(os.path.abspath(__file__)),
+                _SHARED_CONTEXT_FILES),
+            source_fingerprint,
+            long_description,
+        ]
+        if target != 'sdist':
+            # sdist does not depend on the Python version.
+            parts.append(json.dumps(
+                WHEEL_PYTHON_VERSIONS[python_version], sort_keys=True))
+            if recompress:
+                parts.append('recompress')
+            if reproducible:
+                parts.append('reproducible')
+        if source_date_epoch is not None:
+            parts.append(f'SOURCE_DATE_EPOCH={source_date_epoch}')
+        return cache_key(*parts)
+
+    def _is_build_cached(
+        self,
+        target: str,
+        cuda_version: str | None,
+        python_versions: Sequence[str],
+        source: str,
+        build_cache: str,
+        source_fingerprint: str,
+        recompress: bool = False,
+        reproducible: bool = False,
+    ) -> bool:
+        """Returns True if all assets of the build are in the build cache."""
+        version = get_version_from_source_tree(source)
+        long_description = self._long_description(cuda_version)
+        assets = self._linux_assets(cuda_version, version, python_versions)
+        source_date_epoch = (
+            get_source_date_epoch(source) if reproducible else None)
+        for python_version, (_, asset_dest_name) in zip(
+                python_versions, assets):
+            fingerprint = self._build_fingerprint(
+                target, cuda_version, python_version, source_fingerprint,
+                long_description, recompress, reproducible, source_date_epoch)
+            path = f'{build_cache}/{fingerprint}/{asset_dest_name}'
+            if not os.path.exists(path):
+                return False
+        return True
+
+    def _prepare_builder_linux(
+        self,
+        target: str,
+        cuda_version: str | None,
+        source: str,
+        push: bool,
+        mount_preloads: bool = False,
+        opt_lib_cache: str | None = None,
+        opt_lib_cache_size: int = 10,
+        pull_base: bool = False,
+    ) -> str:
+        """Create a builder image shared by builds in the matrix."""
+
+        workdir = tempfile.mkdtemp(prefix='cupy-dist-')
+        try:
+            log(f'Using working directory: {workdir}')
+            return self._setup_builder_linux(
+                target, cuda_version, source, workdir, push, mount_preloads,
+                opt_lib_cache, opt_lib_cache_size, pull_base)
+        finally:
+            log(f'Removing working directory: {workdir}')
+            shutil.rmtree(workdir)
+
+    def build_matrix(
+        self,
+        cuda_version: str | None,
+        python_versions: Sequence[str],
+        source: str,
+        output: str,
+        jobs: int,
+        batch_python: bool,
+        dry_run: bool,
+        push: bool,
+        rmi: bool,
+        snapshot: SnapshotMode = 'auto',
+        compiler_cache: str | None = None,
+        compiler_cache_size: int = 20,
+        build_cache: str | None = None,
+        build_cache_size: int = 50,
+        mount_preloads: bool = False,
+        opt_lib_cache: str | None = None,
+        opt_lib_cache_size: int = 10,
+        size_baseline: str | None = None,
+        recompress: bool = False,
+        reproducible: bool = False,
+        pull_base: bool = False,
+    ) -> None:
+        """Build all wheel distributions for Linux (and sdist) concurrently.
+
+        Builder images are created once for each build target and shared
+        among builds for all Python versions.  If `batch_python` is True,
+        wheels for all Python versions are built in a single container run
+        for each build target.  Builder images are not created for build
+        targets whose assets are all found in the build cache.
+        """
+
+        source = os.path.abspath(source)
+        if cuda_version is not None:
+            if cuda_version not in WHEEL_LINUX_CONFIGS:
+                raise ValueError(f'unknown CUDA version: {cuda_version}')
+            targets: list[tuple[str, str | None]] = [
+                ('wheel-linux', cuda_version)]
+        else:
+            targets = [('sdist', None)] + [
+                ('wheel-linux', x) for x in WHEEL_LINUX_CONFIGS]
+
+        if len(python_versions) == 0:
+            python_versions = list(WHEEL_PYTHON_VERSIONS)
+        # sdist does not depend on Python; use the latest GIL-enabled one.
+        sdist_python_version = ([
+            x for x in python_versions if not x.endswith('t')
+        ] or python_versions)[-1]
+
+        def _label(
+            target: str, cuda: str | None, pythons: Sequence[str]
+        ) -> str:
+            name = 'sdist' if cuda is None else cuda
+            if len(pythons) == 0:
+                return name
+            return f'{name} / Py {", ".join(pythons)}'
+
+        def _log_context(label: str) -> AbstractContextManager[None]:
+            # Buffer logs and outputs of commands of each worker so that
+            # they are not interleaved (see `verify_linux`).
+            title = f'Build: {label}'
+            return log_group(title) if jobs == 1 else log_buffered(title)
+
+        def _prepare(target: str, cuda: str | None) -> str:
+            label = _label(target, cuda, [])
+            with _log_context(f'{label} (builder image)'), log_label(label):
+                return self._prepare_builder_linux(
+                    target, cuda, source, push, mount_preloads,
+                    opt_lib_cache, opt_lib_cache_size, pull_base)
+
+        def _build(
+            target: str, cuda: str | None, pythons: Sequence[str]
+        ) -> None:
+            label = _label(target, cuda, pythons)
+            with _log_context(label), log_label(label):
+                self.build_linux(
+                    target, cuda, pythons, source, output, dry_run, push,
+                    False, image_ready=True, snapshot=snapshot,
+                    compiler_cache=compiler_cache,
+                    compiler_cache_size=compiler_cache_size,
+                    evict_compiler_cache=False,
+                    build_cache=build_cache, build_cache_size=build_cache_size,
+                    source_fingerprint=source_fingerprint,
+                    mount_preloads=mount_preloads,
+                    opt_lib_cache=opt_lib_cache,
+                    opt_lib_cache_size=opt_lib_cache_size,
+                    size_baseline=size_baseline, recompress=recompress,
+                    reproducible=reproducible,
+                    # Share CPUs among builds running concurrently.
+                    rewrite_jobs=max((os.cpu_count() or 1) // jobs, 1),
+                    trace=False)
+
+        def _batches(target: str) -> list[list[str]]:
+            if target == 'sdist':
+                return [[sdist_python_version]]
+            elif batch_python:
+                return [list(python_versions)]
+            return [[x] for x in python_versions]
+
+        with log_group('Build Matrix: Setup'):
+            source_fingerprint = None
+            if build_cache is not None and not dry_run:
+                log(f'Computing fingerprint of source tree: {source}')
+                source_fingerprint = fingerprint_source_tree(source, snapshot)
+
+            # Look up the build cache to skip creating builder images.
+            cached = []
+            if source_fingerprint is not None:
+                assert build_cache is not None
+                build_cache = os.path.abspath(build_cache)
+                for target, cuda in targets:
+                    if self._is_build_cached(
+                            target, cuda, [
+                                x for pythons in _batches(target)
+                                for x in pythons],
+                            source, build_cache, source_fingerprint,
+                            recompress, reproducible):
+                        log('All assets found in build cache, skipping '
+                            f'builder image: {_label(target, cuda, [])}')
+                        cached.append((target, cuda))
+
+            # Evict compiler caches once before builds, keeping caches of
+            # all build targets, as builds running concurrently share the
+            # directory.
+            if compiler_cache is not None and not dry_run:
+                compiler_cache = os.path.abspath(compiler_cache)
+                os.makedirs(compiler_cache, exist_ok=True)
+                keep = [
+                    os.path.basename(compiler_cache_dir(
+                        compiler_cache, cuda or 'sdist',
+                        SDIST_CONFIG['image'] if cuda is None
+                        else WHEEL_LINUX_CONFIGS[cuda]['image']))
+                    for _, cuda in targets
+                ]
+                for name in evict_lru(
+                        compiler_cache, compiler_cache_size * 1024 ** 3,
+                        keep=keep):
+                    log(f'Evicted compiler cache: {name}')
+
+        log(f'Building {len(targets)} target(s) with {jobs} worker(s)')
+        results: dict[str, BaseException | None] = {}
+        image_tags: list[str] = []
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            prepares: dict[Future[str], tuple[str, str | None]] = {
+                executor.submit(_prepare, target, cuda): (target, cuda)
+                for target, cuda in targets
+                if (target, cuda) not in cached
+            }
+            builds: dict[Future[None], str] = {}
+            for target, cuda in cached:
+                for pythons in _batches(target):
+                    f = executor.submit(_build, target, cuda, pythons)
+                    builds[f] = _label(target, cuda, pythons)
+            for prepare in as_completed(prepares):
+                target, cuda = prepares[prepare]
+                error = prepare.exception()
+                if error is not None:
+                    log(f'Failed to create builder image: {error!r}')
+                    results[_label(target, cuda, [])] = error
+                    continue
+                image_tags.append(prepare.result())
+                if dry_run:
+                    continue
+                for pythons in _batches(target):
+                    f = executor.submit(_build, target, cuda, pythons)
+                    builds[f] = _label(target, cuda, pythons)
+            for build in as_completed(builds):
+                error = build.exception()
+                if error is not None:
+                    log(f'Build failed ({builds[build]}): {error!r}')
+                results[builds[build]] = error
+
+        if rmi:
+            log('Removing builder Docker images')
+            for image_tag in image_tags:
+                self._remove_container_image(image_tag)
+
+        with log_group('Build Matrix Summary'):
+            for label in sorted(results):
+                status = 'FAIL' if results[label] is not None else 'PASS'
+                log(f'  {status}: {label}')
+            trace_path = f'{output}/build-matrix.trace.json'
+            log(f'Writing trace to: {trace_path}')
+            write_trace(trace_path)
+        failures = sorted(k for k, v in results.items() if v is not None)
+        if 0 < len(failures):
+            raise RuntimeError(
+                f'{len(failures)} build(s) failed: {", ".join(failures)}')
+
+    @staticmethod
+    def plan(
+        cuda_version: str | None,
+        python_versions: Sequence[str],
+        jobs: int,
+        verify_jobs: int,
+        history: str,
+        time_limit: int,
+        plan_output: str | None,
+    ) -> None:
+        """Plan the release for Linux.
+
+        Shows steps of the release (see `dist_plan`) with their durations
+        estimated from traces in `history`, the critical path, and the
+        estimated time to run all steps with `jobs` workers of build-matrix
+        and `verify_jobs` systems verifying each distribution concurrently.
+        The parallelism beyond which adding workers barely shortens the
+        time is suggested (see `suggest_workers`).
+        """
+
+        steps = build_plan(cuda_version, python_versions)
+        traces = find_traces(history) if os.path.isdir(history) else []
+        log(f'Estimating durations from {len(traces)} trace(s) in {history}')
+        estimate_durations(steps, load_history(traces))
+
+        log(f'Steps ({len(steps)}):')
+        width = max(len(x['label']) for x in steps.values())
+        for step in steps.values():
+            log(f'  {step["kind"]:<7}  {step["label"]:<{width}}  '
+                f'{format_duration(step["duration"])} ({step["estimate"]})')
+        for step_id, step in steps.items():
+            dependents = [x for x in steps.values() if step_id in x['deps']]
+            if step['kind'] == 'image' and 1 < len(dependents):
+                log(f'Shared image: {step["label"]} '
+                    f'({len(dependents)} steps)')
+
+        path = critical_path(steps)
+        path_duration = sum(steps[x]['duration'] for x in path)
+        log(f'Critical path ({format_duration(path_duration)}):')
+        for step_id in path:
+            log(f'  {steps[step_id]["label"]} '
+                f'({format_duration(steps[step_id]["duration"])})')
+
+        total = sum(x['duration'] for x in steps.values())
+        makespan, _ = simulate(steps, jobs, verify_jobs)
+        _, peak = simulate(steps, None)
+        systems = max(collections.Counter(
+            x['pool'] for x in steps.values()
+            if x['kind'] == 'verify').values())
+        # Verifications are suggested first, without limiting builds.
+        suggested_verify_jobs = suggest_workers(
+            lambda x: simulate(steps, None, x)[0], systems)
+        suggested_jobs = suggest_workers(
+            lambda x: simulate(steps, x, suggested_verify_jobs)[0],
+            max(peak, 1))
+        suggested_makespan, _ = simulate(
+            steps, suggested_jobs, suggested_verify_jobs)
+        log(f'Total work: {format_duration(total)}')
+        log(f'Estimated time with {jobs} build worker(s) and {verify_jobs} '
+            f'verification(s) per distribution: {format_duration(makespan)} '
+            f'(time limit: {format_duration(time_limit)})')
+        log(f'Suggested parallelism: --jobs {suggested_jobs} for '
+            f'build-matrix and --jobs {suggested_verify_jobs} for verify '
+            f'(estimated time: {format_duration(suggested_makespan)})')
+        if time_limit < makespan:
+            log('WARNING: estimated time exceeds the time limit')
+
+        if plan_output is not None:
+            log(f'Writing plan to: {plan_output}')
+            export_plan(plan_output, steps)
 
     @staticmethod
     def _check_windows_environment(
@@ -586,6 +2028,19 @@ class Controller:
                 f'Cannot build wheel for CUDA {cuda_version} '
                 f'using CUDA {current_cuda_version}')
 
+    @staticmethod
+    def _copy_agent_lib(workdir: str) -> str:
+        """Copies modules shared by agents to the working directory.
+
+        Returns the path to the directory, to be added to `PYTHONPATH` of
+        agents run on the host.  Only the shared modules are placed in the
+        directory so that it does not shadow other modules (e.g., `cupy`).
+        """
+        agent_lib = f'{workdir}/agent_lib'
+        os.mkdir(agent_lib)
+        shutil.copy2('agent_trace.py', agent_lib)
+        return agent_lib
+
     def build_windows(
         self,
         target: str,
@@ -593,6 +2048,9 @@ class Controller:
         python_version: str,
         source: str,
         output: str,
+        snapshot: SnapshotMode = 'auto',
+        opt_lib_cache: str | None = None,
+        opt_lib_cache_size: int = 10,
     ) -> None:
         """Build a single wheel distribution for Windows.
 
@@ -652,9 +2110,8 @@ class Controller:
         try:
             log(f'Using working directory: {workdir}')
 
-            # Copy source tree to working directory.
-            log(f'Copying source tree from: {source}')
-            shutil.copytree(source, f'{workdir}/cupy')
+            # Create a snapshot of the source tree in working directory.
+            snapshot_source(source, f'{workdir}/cupy', snapshot)
 
             # Rename project name
             rename_project(f'{workdir}/cupy/pyproject.toml', package_name)
@@ -670,10 +2127,10 @@ class Controller:
             log('Creating CUDA optional lib directory under '
                 f'working directory: {optlib_workdir}')
             os.mkdir(optlib_workdir)
-            for p in preloads:
-                install_cuda_opt_library(
-                    p, cuda_version, 'x86_64', optlib_workdir,
-                    workdir=workdir)
+            install_cuda_opt_libraries(
+                preloads, cuda_version, 'x86_64', optlib_workdir,
+                source='cupy', workdir=workdir, cache=opt_lib_cache,
+                cache_size=opt_lib_cache_size)
 
             # Create a wheel metadata file for preload.
             log('Creating wheel metadata')
@@ -692,16 +2149,25 @@ class Controller:
                 '--dst', os.environ['CUDA_PATH'],
                 cwd=workdir)
 
+            # Copy files shared by agents.
+            agent_lib = self._copy_agent_lib(workdir)
+
             # Build.
             log('Starting build')
-            run_command(
-                sys.executable, f'{os.getcwd()}/builder/agent.py',
-                *agent_args, cwd=workdir)
+            try:
+                run_command(
+                    sys.executable, f'{os.getcwd()}/builder/agent.py',
+                    '--trace', f'{workdir}/agent.trace.json',
+                    *agent_args, cwd=workdir,
+                    extra_env={'PYTHONPATH': agent_lib})
+            finally:
+                merge_trace(f'{workdir}/agent.trace.json', 'builder')
             log('Finished build')
 
-            # Copy assets.
+            # Check and copy assets.
             asset_path = f'{workdir}/cupy/dist/{asset_name}'
             output_path = f'{output}/{asset_dest_name}'
+            self._check_asset(asset_path, asset_name)
             log(f'Copying asset from {asset_path} to {output_path}')
             shutil.copy2(asset_path, output_path)
 
@@ -715,19 +2181,47 @@ class Controller:
                 # Python 2). Note that PermissionError inherits OSError.
                 log(f'Failed to clean-up working directory: {e}\n\n'
                     f'Please remove the working directory manually: {workdir}')
+            trace_path = f'{output}/{asset_dest_name}.build.trace.json'
+            log(f'Writing trace to: {trace_path}')
+            write_trace(trace_path)
 
     def verify_linux(
         self,
         target: Literal['sdist', 'wheel-linux'],
         cuda_version: str | None,
-        python_version: str,
-        dist: str,
+        python_versions: Sequence[str],
+        dists: Sequence[str],
         tests: Iterable[str],
         dry_run: bool,
         push: bool,
         rmi: bool,
+        jobs: int = 1,
+        wheelhouse: str | None = None,
+        offline: bool = False,
+        test_shards: int = 1,
+        smoke_first: bool = False,
+        pull_base: bool = False,
     ) -> None:
-        """Verify a single distribution for Linux."""
+        """Verify distributions for Linux.
+
+        Each distribution in `dists` is verified with the Python version at
+        the same position in `python_versions`; all of them are verified in
+        a single container run on each system.
+        If `jobs` is larger than 1, verification on each system runs
+        concurrently, and logs are emitted per system after completion.
+        If `wheelhouse` is given, dependencies are resolved and downloaded
+        to the wheelhouse once, and installed from it on every system.
+        Tests on each system are split into `test_shards` processes (see
+        `VerifierAgent._run_pytest`), and their JUnit XML reports are
+        collected to `<dist>.junit`.
+        If `smoke_first` is set, only installation and import checks (see
+        `--smoke-only` of the verifier agent) are run on all systems
+        concurrently first, and tests are run only after they pass on
+        every system.
+        """
+        assert len(python_versions) == len(dists)
+        dist_label = ', '.join(dists)
+        python_label = ', '.join(python_versions)
 
         kind: Literal['cuda', 'rocm']
         if target == 'sdist':
@@ -752,46 +2246,242 @@ class Controller:
         else:
             raise RuntimeError('unknown target')
 
-        for system in systems:
-            with log_group(f'Verify: {dist} ({system} / Py {python_version})'):
-                image = base_image.format(system=system)
-                image_tag_system = f'{image_tag}-{system}'
-                log(f'Starting verification for {dist} on {image} '
-                    f'with Python {python_version}')
+        lock_keys = None
+        if wheelhouse is not None and not dry_run:
+            wheelhouse = os.path.abspath(wheelhouse)
+            lock_keys = []
+            for python_version, dist in zip(python_versions, dists):
+                with log_group(f'Wheelhouse: {dist} (Py {python_version})'):
+                    lock_keys.append(self._prepare_wheelhouse(
+                        wheelhouse, dist, python_version, kind, cuda_version,
+                        preloads,
+                        [base_image.format(system=x) for x in systems],
+                        offline))
+
+        def _verify(system: str, smoke_only: bool) -> None:
+            image = base_image.format(system=system)
+            image_tag_system = f'{image_tag}-{system}'
+            log(f'Starting {"smoke test" if smoke_only else "verification"} '
+                f'for {dist_label} on {image} with Python {python_label}')
+            with history_step('smoke' if smoke_only else 'verify',
+                              cuda_version or 'sdist',
+                              ','.join(python_versions), system):
                 self._verify_linux(
-                    image_tag_system, image, kind, dist, tests,
-                    python_version,
+                    image_tag_system, image, kind, dists, tests,
+                    python_versions,
                     cuda_version, preloads, system_packages, dry_run, push,
-                    rmi)
+                    rmi and not smoke_only, wheelhouse, lock_keys, offline,
+                    test_shards, smoke_only, pull_base)
+
+        def _run_tier(smoke_only: bool, jobs: int) -> None:
+            name = 'Smoke Test' if smoke_only else 'Verify'
+
+            def _title(system: str) -> str:
+                return f'{name}: {dist_label} ({system} / Py {python_label})'
+
+            if jobs == 1:
+                for system in systems:
+                    with log_group(_title(system)):
+                        _verify(system, smoke_only)
+                return
+
+            durations: dict[str, float] = {}
+
+            def _verify_buffered(system: str) -> None:
+                start = time.monotonic()
+                with log_buffered(_title(system)):
+                    try:
+                        _verify(system, smoke_only)
+                    except BaseException as e:
+                        log(f'{name} failed: {e!r}')
+                        raise
+                    finally:
+                        durations[system] = time.monotonic() - start
+
+            log(f'{name}: running on {len(systems)} system(s) with {jobs} '
+                'worker(s)')
+            results: dict[str, BaseException | None] = {}
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                futures = {
+                    executor.submit(_verify_buffered, system): system
+                    for system in systems
+                }
+                for future in as_completed(futures):
+                    results[futures[future]] = future.exception()
+
+            with log_group(
+                    f'{name} Summary: {dist_label} (Py {python_label})'):
+                width = max(len(x) for x in systems)
+                for system in systems:
+                    status = 'FAIL' if results[system] is not None else 'PASS'
+                    log(f'  {status}  {system:<{width}}  '
+                        f'({durations[system]:.0f} s)')
+            failures = [x for x in systems if results[x] is not None]
+            if 0 < len(failures):
+                raise RuntimeError(
+                    f'{name} failed on {len(failures)} system(s): '
+                    f'{", ".join(failures)}')
+
+        if smoke_first:
+            # Run cheap checks on all systems at once so that broken
+            # distributions (e.g., preload configurations) are found before
+            # running tests on any system.
+            _run_tier(True, len(systems))
+        _run_tier(False, jobs)
+
+    @staticmethod
+    def _prepare_wheelhouse(
+        wheelhouse: str,
+        dist: str,
+        python_version: str,
+        kind: Literal['cuda', 'rocm'],
+        cuda_version: str | None,
+        preloads: Collection[str],
+        images: Iterable[str],
+        offline: bool,
+    ) -> str:
+        """Resolves and downloads packages needed to verify the dist.
+
+        Packages are downloaded to the wheelhouse for the platform of the
+        verifier, and the resolution is recorded as a lock (constraints
+        file) so that the verifier installs exactly the same versions
+        without dependency resolution.  If the lock already exists and all
+        files in it are intact, nothing is downloaded.  Returns the key of
+        the lock.
+        """
+        pyconfig = WHEEL_PYTHON_VERSIONS[python_version]
+        arch = 'x86_64'
+        if cuda_version is not None:
+            arch = WHEEL_LINUX_CONFIGS[cuda_version].get('arch', 'x86_64')
+
+        # Requirements resolved together and pinned in the lock.
+        requirements = read_dist_requirements(dist)
+        if dist.endswith('.tar.gz'):
+            requirements += read_build_requirements(dist)
+        if 'nccl' in preloads:
+            assert cuda_version is not None
+            cuda_major = cuda_version.split('.')[0]
+            requirements.append(
+                f'nvidia-nccl-cu{cuda_major}=={VERIFY_NCCL_VERSION}')
+
+        # CUDA Runtime headers installed by `setup_cuda_runtime_headers.py`
+        # depend on the CUDA version of each system; they are available in
+        # the wheelhouse but not pinned.
+        runtime_requirements = set()
+        if kind == 'cuda':
+            for image in images:
+                match = re.search(r':(\d+)\.(\d+)\.\d+', image)
+                if match is None:
+                    raise RuntimeError(
+                        f'cannot detect CUDA version from image: {image}')
+                major, minor = match.groups()
+                suffix = '-cu12' if major == '12' else ''
+                runtime_requirements.add(
+                    f'nvidia-cuda-runtime{suffix}=={major}.{minor}.*')
+
+        key = cache_key(
+            pyconfig['abi_tag'], arch, *sorted(requirements), '',
+            *sorted(runtime_requirements))
+        lock = wheelhouse_lock_path(wheelhouse, key)
+        if check_wheelhouse_lock(wheelhouse, key):
+            log(f'Using wheelhouse lock: {lock}')
+            return key
+        if offline:
+            raise RuntimeError(
+                f'Wheelhouse lock for {dist} (Py {python_version}) is '
+                f'unavailable in offline mode: {lock}')
+
+        log(f'Resolving requirements: {requirements} + '
+            f'{sorted(runtime_requirements)}')
+        os.makedirs(wheelhouse, exist_ok=True)
+        download_args = [
+            sys.executable, '-m', 'pip', 'download',
+            '--find-links', wheelhouse,
+            '--only-binary=:all:',
+            '--platform', f'manylinux_2_28_{arch}',
+            '--platform', f'manylinux2014_{arch}',
+            '--implementation', 'cp',
+            '--python-version', python_version.rstrip('t'),
+            '--abi', pyconfig['abi_tag'],
+        ]
+        tmpdir = tempfile.mkdtemp(prefix='.download-', dir=wheelhouse)
+        try:
+            run_command(
+                *download_args, '--dest', f'{tmpdir}/base', *requirements)
+            pins = []
+            for filename in os.listdir(f'{tmpdir}/base'):
+                name, version = filename.split('-')[:2]
+                pins.append(f'{name.replace("_", "-").lower()}=={version}')
+            for req in sorted(runtime_requirements):
+                run_command(
+                    *download_args, '--dest', f'{tmpdir}/runtime', req)
+            filenames = set()
+            for subdir in ('base', 'runtime'):
+                if not os.path.isdir(f'{tmpdir}/{subdir}'):
+                    continue
+                for filename in os.listdir(f'{tmpdir}/{subdir}'):
+                    os.replace(
+                        f'{tmpdir}/{subdir}/{filename}',
+                        f'{wheelhouse}/{filename}')
+                    filenames.add(filename)
+        finally:
+            shutil.rmtree(tmpdir)
+        write_wheelhouse_lock(wheelhouse, key, pins, filenames)
+        log(f'Created wheelhouse lock: {lock} ({len(filenames)} files)')
+        return key
 
     def _verify_linux(
         self,
         image_tag: str,
         base_image: str,
         kind: Literal['cuda', 'rocm'],
-        dist: str,
+        dists: Sequence[str],
         tests: Iterable[str],
-        python_version: str,
+        python_versions: Sequence[str],
         cuda_version: str | None,
         preloads: Collection[str],
         system_packages: str,
         dry_run: bool,
         push: bool,
         rmi: bool,
+        wheelhouse: str | None = None,
+        lock_keys: Sequence[str] | None = None,
+        offline: bool = False,
+        test_shards: int = 1,
+        smoke_only: bool = False,
+        pull_base: bool = False,
     ) -> None:
-        dist_basename = os.path.basename(dist)
-
         # Arguments for the agent.
-        agent_args = [
-            '--python', WHEEL_PYTHON_VERSIONS[python_version]['pyenv'],
-            '--dist', dist_basename,
-            '--chown', f'{os.getuid()}:{os.getgid()}',
-        ]
+        agent_args = ['--chown', f'{os.getuid()}:{os.getgid()}']
+        for python_version, dist in zip(python_versions, dists):
+            agent_args += [
+                '--python', WHEEL_PYTHON_VERSIONS[python_version]['pyenv'],
+                '--dist', os.path.basename(dist),
+            ]
         if 0 < len(preloads):
             assert cuda_version is not None
             agent_args += ['--cuda', cuda_version]
             for p in preloads:
                 agent_args += ['--preload', p]
+            if 'nccl' in preloads:
+                agent_args += ['--nccl-version', VERIFY_NCCL_VERSION]
+        docker_opts = []
+        if wheelhouse is not None and lock_keys is not None:
+            docker_opts += ['--volume', f'{wheelhouse}:/wheelhouse:ro']
+            agent_args += ['--wheelhouse', '/wheelhouse']
+            for lock_key in lock_keys:
+                agent_args += [
+                    '--constraint', '/wheelhouse/' + os.path.relpath(
+                        wheelhouse_lock_path(wheelhouse, lock_key),
+                        wheelhouse),
+                ]
+            if offline:
+                agent_args += ['--offline']
+        if smoke_only:
+            agent_args += ['--smoke-only']
+        else:
+            agent_args += [
+                '--shards', str(test_shards), '--junit-dir', 'junit']
 
         # Add arguments for `python -m pytest`.
         agent_args += ['tests']
@@ -802,9 +2492,10 @@ class Controller:
         try:
             log(f'Using working directory: {workdir}')
 
-            # Copy dist and tests to working directory.
-            log(f'Copying distribution from: {dist}')
-            shutil.copy2(dist, f'{workdir}/{dist_basename}')
+            # Copy dists and tests to working directory.
+            for dist in dict.fromkeys(dists):
+                log(f'Copying distribution from: {dist}')
+                shutil.copy2(dist, f'{workdir}/{os.path.basename(dist)}')
             tests_dir = f'{workdir}/tests'
             os.mkdir(tests_dir)
             for test in tests:
@@ -817,10 +2508,13 @@ class Controller:
             docker_ctx = f'{workdir}/verifier'
             log(f'Copying verifier directory to: {docker_ctx}')
             shutil.copytree('verifier/', docker_ctx)
+            for f in _SHARED_CONTEXT_FILES:
+                shutil.copy2(f, docker_ctx)
 
             # Creates a Docker image to verify specified distribution.
             self._create_verifier_linux(
-                image_tag, base_image, system_packages, docker_ctx, push)
+                image_tag, base_image, system_packages, docker_ctx, push,
+                pull_base)
 
             if dry_run:
                 log('Dry run requested, exiting without actual verification.')
@@ -828,7 +2522,16 @@ class Controller:
 
             # Verify.
             log('Starting verification')
-            self._run_container(image_tag, kind, workdir, agent_args)
+            try:
+                self._run_container(
+                    image_tag, kind, workdir, agent_args,
+                    docker_opts=docker_opts, trace=f'verifier ({image_tag})')
+            finally:
+                for python_version, dist in zip(python_versions, dists):
+                    pyenv = WHEEL_PYTHON_VERSIONS[python_version]['pyenv']
+                    self._collect_junit(
+                        f'{workdir}/junit', f'junit-py{pyenv}',
+                        f'{dist}.junit', image_tag.rsplit(':', 1)[-1])
             log('Finished verification')
 
             # Remove Docker image.
@@ -840,6 +2543,50 @@ class Controller:
             log(f'Removing working directory: {workdir}')
             shutil.rmtree(workdir)
 
+    @staticmethod
+    def _collect_junit(
+        junit_dir: str, name: str, dest_dir: str, prefix: str
+    ) -> None:
+        """Summarizes JUnit XML reports and copies them to `dest_dir`.
+
+        Reports named `<name>.xml` or `<name>-<shard>.xml` (see
+        `VerifierAgent._run_pytest`) are collected.
+        """
+        if not os.path.isdir(junit_dir):
+            return
+        reports = sorted(
+            x for x in os.listdir(junit_dir)
+            if re.fullmatch(rf'{re.escape(name)}(-\d+)?\.xml', x))
+        if len(reports) == 0:
+            return
+        durations: list[tuple[float, str]] = []
+        failed = skipped = 0
+        os.makedirs(dest_dir, exist_ok=True)
+        for report in reports:
+            try:
+                tree = ET.parse(f'{junit_dir}/{report}')
+            except ET.ParseError as e:
+                # The report may be truncated if pytest was killed.
+                log(f'WARNING: skipping broken JUnit XML report: {report} '
+                    f'({e})')
+                continue
+            for case in tree.iter('testcase'):
+                durations.append((
+                    float(case.get('time', 0)),
+                    f'{case.get("classname")}::{case.get("name")}'))
+                if (case.find('failure') is not None or
+                        case.find('error') is not None):
+                    failed += 1
+                elif case.find('skipped') is not None:
+                    skipped += 1
+            shutil.copy2(
+                f'{junit_dir}/{report}', f'{dest_dir}/{prefix}-{report}')
+        log(f'Tests: {len(durations)} run, {failed} failed, {skipped} '
+            f'skipped, {sum(x for x, _ in durations):.0f} s in total '
+            f'(reports: {dest_dir}/{prefix}-{name}*.xml)')
+        for duration, test in sorted(durations, reverse=True)[:5]:
+            log(f'  {duration:8.1f} s  {test}')
+
     def verify_windows(
         self,
         target: str,
@@ -890,11 +2637,19 @@ class Controller:
                     test,
                     f'{tests_dir}/{os.path.basename(test)}')
 
+            # Copy files shared by agents.
+            agent_lib = self._copy_agent_lib(workdir)
+
             # Verify.
             log('Starting verification')
-            run_command(
-                sys.executable, f'{os.getcwd()}/verifier/agent.py',
-                *agent_args, cwd=workdir)
+            try:
+                run_command(
+                    sys.executable, f'{os.getcwd()}/verifier/agent.py',
+                    '--trace', f'{workdir}/agent.trace.json',
+                    *agent_args, cwd=workdir,
+                    extra_env={'PYTHONPATH': agent_lib})
+            finally:
+                merge_trace(f'{workdir}/agent.trace.json', 'verifier')
             log('Finished verification')
 
         finally:
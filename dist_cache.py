@@ -0,0 +1,232 @@
+"""
+Host-side caches shared among builds and verifications.
+
+Caches evicted by `evict_lru` are directories whose entries (direct
+children) are removed in least-recently-used order.  Entries are marked as
+used by updating their modification time.
+"""
+from __future__ import annotations
+
+import email.parser
+import hashlib
+import json
+import os
+import re
+import shutil
+import stat
+import tarfile
+import zipfile
+from typing import TYPE_CHECKING
+
+import tomli
+
+if TYPE_CHECKING:
+    from collections.abc import Collection, Iterable
+
+
+def cache_key(*parts: str) -> str:
+    """Returns a key (SHA256 digest) computed from the given parts."""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode('UTF-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def get_size(path: str) -> int:
+    """Returns the total size of files under the path in bytes."""
+    if not os.path.isdir(path) or os.path.islink(path):
+        return os.lstat(path).st_size
+    total = 0
+    for dirpath, _, files in os.walk(path):
+        for f in files:
+            try:
+                total += os.lstat(os.path.join(dirpath, f)).st_size
+            except FileNotFoundError:
+                # Removed concurrently.
+                pass
+    return total
+
+
+def tree_digest(root: str, files: Iterable[str] | None = None) -> str:
+    """Returns a digest (SHA256) of paths and contents of files.
+
+    `files` are paths relative to `root`; all files under `root` except for
+    Python bytecode (`__pycache__` and `*.pyc`) are included if not
+    specified.  Symbolic links are not followed.  The executable bit of
+    files is also reflected.
+    """
+    if files is None:
+        files = sorted(
+            os.path.relpath(os.path.join(dirpath, f), root)
+            for dirpath, _, filenames in os.walk(root)
+            if '__pycache__' not in dirpath.split(os.sep)
+            for f in filenames if not f.endswith('.pyc'))
+    h = hashlib.sha256()
+    for path in files:
+        filepath = os.path.join(root, path)
+        h.update(path.encode('UTF-8'))
+        h.update(b'\0')
+        if os.path.islink(filepath):
+            h.update(b'link:' + os.fsencode(os.readlink(filepath)))
+        elif os.path.isfile(filepath):
+            if os.lstat(filepath).st_mode & stat.S_IXUSR:
+                h.update(b'exec:')
+            with open(filepath, 'rb') as f:
+                while chunk := f.read(1024 * 1024):
+                    h.update(chunk)
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def touch(path: str) -> None:
+    """Marks the cache entry as used."""
+    os.utime(path)
+
+
+def evict_lru(
+    root: str, max_bytes: int, keep: Collection[str] = ()
+) -> list[str]:
+    """Removes least-recently-used entries until the cache fits the size.
+
+    Entries whose names are listed in `keep` are never removed, nor are
+    temporary entries (`.tmp-*`) being populated by concurrent builds.
+    Returns the names of removed entries.
+    """
+    entries = []
+    total = 0
+    for name in os.listdir(root):
+        if name.startswith('.tmp-'):
+            continue
+        path = os.path.join(root, name)
+        try:
+            size = get_size(path)
+            mtime = os.lstat(path).st_mtime
+        except FileNotFoundError:
+            # Removed concurrently.
+            continue
+        total += size
+        entries.append((mtime, name, size))
+
+    removed = []
+    for _, name, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        if name in keep:
+            continue
+        path = os.path.join(root, name)
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        total -= size
+        removed.append(name)
+    return removed
+
+
+def compiler_cache_dir(root: str, config: str, base_image: str) -> str:
+    """Returns a compiler cache directory for the build config and image.
+
+    The directory is created if it does not exist, and marked as used.
+    """
+    name = re.sub(r'[^A-Za-z0-9_.-]', '_', config)
+    path = os.path.join(root, f'{name}-{cache_key(base_image)[:16]}')
+    os.makedirs(path, exist_ok=True)
+    touch(path)
+    return path
+
+
+def file_sha256(path: str) -> str:
+    """Returns the SHA256 digest of the file."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(1024 * 1024):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def read_dist_requirements(dist: str) -> list[str]:
+    """Returns requirements of the distribution (sdist or wheel).
+
+    Requirements only needed for extras are excluded.
+    """
+    if dist.endswith('.whl'):
+        with zipfile.ZipFile(dist) as z:
+            name = next(
+                x for x in z.namelist()
+                if re.fullmatch(r'[^/]+\.dist-info/METADATA', x))
+            metadata = z.read(name).decode('UTF-8')
+    elif dist.endswith('.tar.gz'):
+        with tarfile.open(dist) as t:
+            member = next(
+                x for x in t.getmembers()
+                if re.fullmatch(r'[^/]+/PKG-INFO', x.name))
+            f = t.extractfile(member)
+            assert f is not None
+            metadata = f.read().decode('UTF-8')
+    else:
+        raise ValueError(f'unknown distribution format: {dist}')
+    message = email.parser.HeaderParser().parsestr(metadata)
+    return [
+        x for x in message.get_all('Requires-Dist', [])
+        if re.search(r'\bextra\s*==', x) is None
+    ]
+
+
+def read_build_requirements(sdist: str) -> list[str]:
+    """Returns requirements to build the sdist (`build-system.requires`)."""
+    with tarfile.open(sdist) as t:
+        member = next(
+            x for x in t.getmembers()
+            if re.fullmatch(r'[^/]+/pyproject\.toml', x.name))
+        f = t.extractfile(member)
+        assert f is not None
+        pyproject = tomli.load(f)
+    return list(pyproject.get('build-system', {}).get('requires', []))
+
+
+def wheelhouse_lock_path(wheelhouse: str, key: str) -> str:
+    """Returns the path to the lock (constraints) file in the wheelhouse."""
+    return os.path.join(wheelhouse, 'locks', f'{key}.txt')
+
+
+def write_wheelhouse_lock(
+    wheelhouse: str,
+    key: str,
+    pins: Collection[str],
+    filenames: Collection[str],
+) -> None:
+    """Writes the lock of the resolution to the wheelhouse.
+
+    The lock consists of a constraints file (`locks/{key}.txt`) pinning
+    `name==version` of resolved packages, and a manifest
+    (`locks/{key}.json`) recording SHA256 of all files in the resolution.
+    """
+    path = wheelhouse_lock_path(wheelhouse, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    manifest = {
+        x: file_sha256(os.path.join(wheelhouse, x)) for x in sorted(filenames)
+    }
+    with open(f'{path[:-4]}.json.tmp', 'w', encoding='UTF-8') as f:
+        json.dump(manifest, f, indent=1)
+    with open(f'{path}.tmp', 'w', encoding='UTF-8') as f:
+        f.writelines(f'{x}\n' for x in sorted(pins))
+    os.replace(f'{path[:-4]}.json.tmp', f'{path[:-4]}.json')
+    os.replace(f'{path}.tmp', path)
+
+
+def check_wheelhouse_lock(wheelhouse: str, key: str) -> bool:
+    """Checks if all files in the lock exist in the wheelhouse intact."""
+    path = wheelhouse_lock_path(wheelhouse, key)
+    if not os.path.exists(path):
+        return False
+    with open(f'{path[:-4]}.json', encoding='UTF-8') as f:
+        manifest: dict[str, str] = json.load(f)
+    for filename, digest in manifest.items():
+        filepath = os.path.join(wheelhouse, filename)
+        if not os.path.exists(filepath) or file_sha256(filepath) != digest:
+            return False
+    return True
@@ -43,6 +43,7 @@ class _WheelLinuxConfig(TypedDict):
     verify_image: str
     verify_systems: list[str]
     system_packages: str
+    size_budget: NotRequired[int]
 
 
 # Key-value of CUDA version and its corresponding build settings for Linux.
@@ -63,6 +64,8 @@ class _WheelLinuxConfig(TypedDict):
 #                     `verify_image`.
 # - `system_packages`: a string of depending library names expanded into the
 #                      package manager command.
+# - `size_budget`: maximum size of the wheel in MiB; the build fails if
+#                  exceeded (optional, default: unlimited)
 WHEEL_LINUX_CONFIGS: dict[str, _WheelLinuxConfig] = {
     '12.x': {
         # CUDA Enhanced Compatibility wheel (for CUDA 12.x)
@@ -88,6 +91,7 @@ WHEEL_LINUX_CONFIGS: dict[str, _WheelLinuxConfig] = {
             '12.9.0-runtime-ubuntu22.04',
         ],
         'system_packages': '',
+        'size_budget': 150,
     },
     '12.x-aarch64': {
         # CUDA Enhanced Compatibility wheel (for CUDA 12.x)
@@ -115,6 +119,7 @@ WHEEL_LINUX_CONFIGS: dict[str, _WheelLinuxConfig] = {
             '12.9.0-runtime-ubi8',
         ],
         'system_packages': '',
+        'size_budget': 150,
     },
     '13.x': {
         # CUDA Enhanced Compatibility wheel (for CUDA 13.x)
@@ -135,6 +140,7 @@ WHEEL_LINUX_CONFIGS: dict[str, _WheelLinuxConfig] = {
             '13.2.1-runtime-ubuntu22.04',
         ],
         'system_packages': '',
+        'size_budget': 150,
     },
     '13.x-aarch64': {
         # CUDA Enhanced Compatibility wheel (for CUDA 13.x)
@@ -156,6 +162,7 @@ WHEEL_LINUX_CONFIGS: dict[str, _WheelLinuxConfig] = {
             '13.2.1-runtime-ubi8',
         ],
         'system_packages': '',
+        'size_budget': 150,
     },
     'rocm-7.0': {
         'name': 'cupy-rocm-7-0',
@@ -167,11 +174,19 @@ WHEEL_LINUX_CONFIGS: dict[str, _WheelLinuxConfig] = {
         'preloads': [],
         'verify_image': 'rocm/dev-ubuntu-24.04:7.0.2',
         'verify_systems': ['default'],
-        'system_packages': 'rocm-hip-sdk hip-runtime-amd roctracer-dev'
+        'system_packages': 'rocm-hip-sdk hip-runtime-amd roctracer-dev',
+        'size_budget': 100,
     },
 }
 
 
+# Version of NCCL installed from PyPI (`nvidia-nccl-cu*`) to verify wheels
+# with NCCL preloading.
+# TODO(kmaehashi): The version should not be pinned here, but unfortunately
+# there's no way to extract the NCCL version supported by CuPy.
+VERIFY_NCCL_VERSION = '2.27.7'
+
+
 class _WheelWindowsConfig(TypedDict):
     name: str
     kind: Literal['cuda']
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Timing history of steps of the release process.
+
+Each step (e.g., a build or a verification on a system) run by `dist.py` is
+recorded to a local SQLite database with its duration, exit status and
+peak memory usage.  Run this file as a script to show trends of durations
+and steps that regressed.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import socket
+import sqlite3
+import statistics
+import sys
+import threading
+import time
+from contextlib import closing, contextmanager
+from typing import TYPE_CHECKING, Any
+
+from dist_plan import format_duration
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS steps (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    config TEXT NOT NULL,
+    python TEXT NOT NULL,
+    system TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    duration REAL NOT NULL,
+    exit_status INTEGER NOT NULL,
+    max_rss_kib INTEGER,
+    host TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS steps_key
+    ON steps (kind, config, python, system, started_at);
+"""
+
+# Path to the database (see `set_history_path`).
+_history_path: str | None = None
+
+# Steps running in the current thread (innermost last).
+_local = threading.local()
+
+
+def set_history_path(path: str | None) -> None:
+    """Sets the path to the database to record steps to."""
+    global _history_path
+    _history_path = path
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=60)
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def record_step(
+    kind: str,
+    config: str,
+    python: str,
+    system: str,
+    started_at: float,
+    duration: float,
+    exit_status: int,
+    max_rss_kib: int | None,
+) -> None:
+    """Records the step to the database, if the path is set."""
+    if _history_path is None:
+        return
+    with closing(_connect(_history_path)) as conn, conn:
+        conn.execute(
+            'INSERT INTO steps (kind, config, python, system, started_at, '
+            'duration, exit_status, max_rss_kib, host) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (kind, config, python, system, started_at, duration,
+             exit_status, max_rss_kib, socket.gethostname()))
+
+
+@contextmanager
+def history_step(
+    kind: str, config: str, python: str = '', system: str = ''
+) -> Iterator[dict[str, Any]]:
+    """Records the duration of the context as a step.
+
+    Yields the step, whose `python` and `system` are inherited by sub-steps
+    recorded with `record_sub_step`.  The exit status is taken from the
+    exception raised (`returncode` if available, otherwise 1).
+    """
+    step: dict[str, Any] = {
+        'kind': kind, 'config': config, 'python': python, 'system': system,
+        'max_rss_kib': None,
+    }
+    stack: list[dict[str, Any]] = _local.__dict__.setdefault('steps', [])
+    stack.append(step)
+    started_at = time.time()
+    start = time.monotonic()
+    exit_status = 0
+    try:
+        yield step
+    except BaseException as e:
+        exit_status = getattr(e, 'returncode', 1)
+        raise
+    finally:
+        stack.pop()
+        record_step(
+            kind, config, python, system, started_at,
+            time.monotonic() - start, exit_status, step['max_rss_kib'])
+
+
+def record_sub_step(
+    kind: str,
+    started_at: float,
+    duration: float,
+    exit_status: int,
+    max_rss_kib: int | None,
+) -> None:
+    """Records a step run within the current step (e.g., in a container)."""
+    stack: list[dict[str, Any]] = _local.__dict__.get('steps', [])
+    if len(stack) == 0:
+        return
+    step = stack[-1]
+    record_step(
+        kind, step['config'], step['python'], step['system'], started_at,
+        duration, exit_status, max_rss_kib)
+
+
+def note_max_rss(max_rss_kib: int) -> None:
+    """Updates the peak memory usage of steps running in the thread."""
+    for step in _local.__dict__.get('steps', []):
+        if step['max_rss_kib'] is None or step['max_rss_kib'] < max_rss_kib:
+            step['max_rss_kib'] = max_rss_kib
+
+
+def load_durations(
+    path: str,
+) -> dict[tuple[str, str, str, str], list[float]]:
+    """Returns durations of succeeded steps keyed by
+    `(kind, config, python, system)`, in the order of the start time.
+    """
+    durations: dict[tuple[str, str, str, str], list[float]] = {}
+    with closing(_connect(path)) as conn:
+        for kind, config, python, system, duration in conn.execute(
+                'SELECT kind, config, python, system, duration FROM steps '
+                'WHERE exit_status = 0 ORDER BY started_at'):
+            durations.setdefault(
+                (kind, config, python, system), []).append(duration)
+    return durations
+
+
+def _format_key(key: tuple[str, str, str, str]) -> str:
+    kind, config, python, system = key
+    return ' / '.join([kind, config, *(
+        [f'Py {python}'] if python else []), *([system] if system else [])])
+
+
+class _HistoryArgs(argparse.Namespace):
+    history: str
+    kind: str | None
+    config: str | None
+    window: int
+    threshold: float
+    min_increase: float
+    regressions: bool
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Show trends of durations of steps and regressions.')
+    parser.add_argument(
+        '--history', type=str,
+        default=os.environ.get('CUPY_RELEASE_TIMING_HISTORY', None),
+        required='CUPY_RELEASE_TIMING_HISTORY' not in os.environ,
+        help='path to the timing history database '
+             '(default: $CUPY_RELEASE_TIMING_HISTORY)')
+    parser.add_argument(
+        '--kind', type=str,
+        help='only show steps of the kind (e.g., build, verify, pytest)')
+    parser.add_argument(
+        '--config', type=str,
+        help='only show steps of the config (e.g., 12.x)')
+    parser.add_argument(
+        '--window', type=int, default=5,
+        help='number of previous runs to compare the latest run with '
+             '(default: 5)')
+    parser.add_argument(
+        '--threshold', type=float, default=0.2,
+        help='ratio of increase of the duration from the median of '
+             'previous runs to flag as a regression (default: 0.2)')
+    parser.add_argument(
+        '--min-increase', type=float, default=30,
+        help='minimum increase of the duration in seconds to flag as a '
+             'regression, to ignore noise of short steps (default: 30)')
+    parser.add_argument(
+        '--regressions', action='store_true', default=False,
+        help='only show steps regressed')
+    args = parser.parse_args(namespace=_HistoryArgs())
+
+    regressions = 0
+    for key, durations in sorted(load_durations(args.history).items()):
+        if ((args.kind is not None and key[0] != args.kind) or
+                (args.config is not None and key[1] != args.config)):
+            continue
+        latest = durations[-1]
+        previous = durations[-1 - args.window:-1]
+        if len(previous) == 0:
+            if not args.regressions:
+                print(f'{_format_key(key)}: {format_duration(latest)} '
+                      '(1 run)')
+            continue
+        baseline = statistics.median(previous)
+        change = (latest - baseline) / baseline if baseline != 0 else 0
+        regressed = (args.threshold < change and
+                     args.min_increase < latest - baseline)
+        regressions += regressed
+        if args.regressions and not regressed:
+            continue
+        print(f'{"REGRESSED: " if regressed else ""}{_format_key(key)}: '
+              f'{format_duration(latest)} ({change:+.1%} from median '
+              f'{format_duration(baseline)} of {len(previous)} previous '
+              f'run(s); trend: '
+              f'{" -> ".join(map(format_duration, [*previous, latest]))})')
+    if regressions != 0:
+        print(f'{regressions} step(s) regressed by more than '
+              f'{args.threshold:.0%}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,435 @@
+"""
+Planner of the release process.
+
+The release is modeled as a DAG of steps (image builds, optional CUDA
+library fetches, builds and verifications) derived from `dist_config`, as
+`build-matrix` and `verify` actions would run them.  Durations of steps are
+estimated from traces recorded by previous runs (see `dist_trace`).
+
+Steps run in pools as the actions run them: builder images and builds share
+the workers of `build-matrix` (`--jobs`), and verifications (including
+verifier images) of each distribution run on a limited number of systems
+concurrently as `verify` does (`--jobs` of verify).
+"""
+from __future__ import annotations
+
+import heapq
+import json
+import os
+import re
+import shlex
+import statistics
+from typing import TYPE_CHECKING, Literal, TypedDict
+
+from dist_config import (
+    CUPY_MAJOR_VERSION,
+    SDIST_CONFIG,
+    WHEEL_LINUX_CONFIGS,
+    WHEEL_PYTHON_VERSIONS,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable, Mapping, Sequence
+
+
+StepKind = Literal['image', 'opt-lib', 'build', 'verify']
+
+
+class Step(TypedDict):
+    kind: StepKind
+    label: str
+    deps: list[str]
+    # Pool of workers running the step (see `simulate`), or None if the step
+    # is not limited.
+    pool: str | None
+    duration: float
+    # Source of the duration: `history` (the step itself), `similar`
+    # (steps of the same kind for the same config) or `default`.
+    estimate: str
+
+
+# Durations (in seconds) assumed for steps without any history.
+_DEFAULT_DURATIONS: dict[StepKind, float] = {
+    'image': 900,
+    'opt-lib': 120,
+    'build': 2400,
+    'verify': 1200,
+}
+
+
+def _image_step_id(tag: str) -> str:
+    return f'image:{tag}'
+
+
+def _build_step_id(cuda_version: str | None, python_version: str) -> str:
+    if cuda_version is None:
+        # sdist does not depend on the Python version.
+        return 'build:sdist'
+    return f'build:{cuda_version}:{python_version}'
+
+
+def _verify_step_id(
+    cuda_version: str | None, python_version: str, system: str
+) -> str:
+    if cuda_version is None:
+        return f'verify:sdist:{system}'
+    return f'verify:{cuda_version}:{python_version}:{system}'
+
+
+def _verify_pool(cuda_version: str | None, python_version: str) -> str:
+    if cuda_version is None:
+        return 'verify:sdist'
+    return f'verify:{cuda_version}:{python_version}'
+
+
+def _config_of(step_id: str) -> str:
+    """Returns the step ID without the Python version and the system."""
+    return ':'.join(step_id.split(':')[:2])
+
+
+def build_plan(
+    cuda_version: str | None, python_versions: Sequence[str]
+) -> dict[str, Step]:
+    """Returns steps of the release keyed by their IDs.
+
+    The matrix is limited to `cuda_version` and `python_versions` if given,
+    as `build-matrix` does.  Steps are listed in a topological order.
+    """
+    if cuda_version is not None:
+        if cuda_version not in WHEEL_LINUX_CONFIGS:
+            raise ValueError(f'unknown CUDA version: {cuda_version}')
+        cuda_versions: list[str | None] = [cuda_version]
+    else:
+        cuda_versions = [None, *WHEEL_LINUX_CONFIGS]
+    if len(python_versions) == 0:
+        python_versions = list(WHEEL_PYTHON_VERSIONS)
+
+    steps: dict[str, Step] = {}
+
+    def _add(
+        step_id: str, kind: StepKind, label: str, deps: list[str],
+        pool: str | None,
+    ) -> None:
+        steps.setdefault(step_id, {
+            'kind': kind, 'label': label, 'deps': deps, 'pool': pool,
+            'duration': 0, 'estimate': 'default',
+        })
+
+    for cuda in cuda_versions:
+        name = 'sdist' if cuda is None else cuda
+        if cuda is None:
+            opt_libs = []
+            systems = SDIST_CONFIG['verify_systems']
+            pythons = python_versions[-1:]
+        else:
+            config = WHEEL_LINUX_CONFIGS[cuda]
+            arch = config.get('arch', 'x86_64')
+            preloads_cuda = config.get('preloads_cuda_version', cuda)
+            opt_libs = [
+                f'opt-lib:{x}:{preloads_cuda}:{arch}'
+                for x in config['preloads']]
+            for library, step_id in zip(config['preloads'], opt_libs):
+                _add(step_id, 'opt-lib',
+                     f'{library} for CUDA {preloads_cuda} ({arch})', [],
+                     None)
+            systems = config['verify_systems']
+            pythons = list(python_versions)
+
+        builder_tag = (
+            f'cupy/cupy-release-tools:builder-{name}-v{CUPY_MAJOR_VERSION}')
+        _add(_image_step_id(builder_tag), 'image', f'builder ({name})',
+             list(opt_libs), 'build')
+        # Verifier images are built by the verification of the first
+        # distribution on each system, and reused by the others.
+        verifier_tag = (
+            f'cupy/cupy-release-tools:verifier-{name}-v{CUPY_MAJOR_VERSION}')
+        for system in systems:
+            _add(_image_step_id(f'{verifier_tag}-{system}'), 'image',
+                 f'verifier ({name} / {system})', [],
+                 _verify_pool(cuda, pythons[0]))
+        for python in pythons:
+            build_id = _build_step_id(cuda, python)
+            _add(build_id, 'build',
+                 name if cuda is None else f'{name} / Py {python}',
+                 [_image_step_id(builder_tag)], 'build')
+            for system in systems:
+                _add(_verify_step_id(cuda, python, system), 'verify',
+                     f'{steps[build_id]["label"]} on {system}',
+                     [build_id, _image_step_id(f'{verifier_tag}-{system}')],
+                     _verify_pool(cuda, python))
+
+    # Sort steps topologically (dependencies are always added earlier, but
+    # shared steps may have been added in between).
+    ordered: dict[str, Step] = {}
+
+    def _visit(step_id: str) -> None:
+        if step_id in ordered:
+            return
+        for dep in steps[step_id]['deps']:
+            _visit(dep)
+        ordered[step_id] = steps[step_id]
+
+    for step_id in steps:
+        _visit(step_id)
+    return ordered
+
+
+def _asset_step_key(asset: str) -> tuple[str | None, str] | None:
+    """Returns `(cuda_version, python_version)` of the asset file name."""
+    if asset.endswith('.tar.gz'):
+        return (None, '')
+    if not asset.endswith('.whl'):
+        return None
+    parts = asset[:-len('.whl')].split('-')
+    if len(parts) != 5:
+        return None
+    name, _, python_tag, abi_tag, platform_tag = parts
+    for cuda, config in WHEEL_LINUX_CONFIGS.items():
+        if (config['name'].replace('-', '_') != name or
+                not platform_tag.endswith(config.get('arch', 'x86_64'))):
+            continue
+        for python, python_config in WHEEL_PYTHON_VERSIONS.items():
+            if (python_config['python_tag'] == python_tag and
+                    python_config['abi_tag'] == abi_tag):
+                return (cuda, python)
+    return None
+
+
+def _option_values(argv: Sequence[str], option: str) -> list[str]:
+    return [argv[i + 1] for i, x in enumerate(argv[:-1]) if x == option]
+
+
+def _history_step_id(event: Mapping[str, object]) -> str | None:
+    """Returns the ID of the step corresponding to the trace event."""
+    name = str(event['name'])
+    if event.get('cat') == 'group':
+        m = re.fullmatch(
+            r'Verify: (?P<dist>.+) \((?P<system>.+) / Py (?P<python>[^)]+)\)',
+            name)
+        # Verifications of several Python versions in a single run are
+        # ignored.
+        if m is None or ',' in m['python']:
+            return None
+        key = _asset_step_key(os.path.basename(m['dist']))
+        if key is None:
+            return None
+        return _verify_step_id(key[0], m['python'], m['system'])
+    if event.get('cat') != 'command':
+        return None
+    try:
+        argv = shlex.split(name)
+    except ValueError:
+        return None
+    if argv[:2] in (['docker', 'build'], ['docker', 'buildx']):
+        tags = _option_values(argv, '--tag')
+        return _image_step_id(tags[0]) if len(tags) == 1 else None
+    if any(x.endswith('install_library.py') for x in argv[:2]):
+        library = _option_values(argv, '--library')
+        cuda = _option_values(argv, '--cuda')
+        arch = _option_values(argv, '--arch')
+        if len(library) == len(cuda) == len(arch) == 1:
+            return f'opt-lib:{library[0]}:{cuda[0]}:{arch[0]}'
+        return None
+    if argv[:2] == ['docker', 'run'] and '--action' in argv:
+        m = next((
+            re.fullmatch(r'cupy/cupy-release-tools:builder-(.+)-v\d+', x)
+            for x in argv
+            if x.startswith('cupy/cupy-release-tools:builder-')), None)
+        if m is None:
+            return None
+        if m[1] == 'sdist':
+            return _build_step_id(None, '')
+        pyenvs = _option_values(argv, '--python')
+        pythons = [
+            k for k, v in WHEEL_PYTHON_VERSIONS.items()
+            if v['pyenv'] in pyenvs]
+        # Builds of several Python versions in a single run are ignored.
+        if len(pythons) != 1:
+            return None
+        return _build_step_id(m[1], pythons[0])
+    return None
+
+
+def load_history(paths: Iterable[str]) -> dict[str, list[float]]:
+    """Returns durations (in seconds) of steps recorded in trace files.
+
+    Only events of the controller (the process ID 0) are used; traces
+    written by several runs (e.g., `*.build.trace.json` written for each
+    asset of a single build) may contain the same event, which is counted
+    once.
+    """
+    seen = set()
+    history: dict[str, list[float]] = {}
+    for path in paths:
+        with open(path, encoding='UTF-8') as f:
+            trace = json.load(f)
+        for event in trace.get('traceEvents', []):
+            if event.get('pid') != 0 or event.get('ph') != 'X':
+                continue
+            if event.get('args', {}).get('exit_code', 0) != 0:
+                continue
+            step_id = _history_step_id(event)
+            if step_id is None:
+                continue
+            key = (step_id, event['ts'], event['dur'])
+            if key in seen:
+                continue
+            seen.add(key)
+            history.setdefault(step_id, []).append(event['dur'] / 1e6)
+    return history
+
+
+def find_traces(directory: str) -> list[str]:
+    """Returns paths to trace files in the directory."""
+    return sorted(
+        os.path.join(directory, x) for x in os.listdir(directory)
+        if x.endswith('.trace.json'))
+
+
+def estimate_durations(
+    steps: Mapping[str, Step], history: Mapping[str, Sequence[float]]
+) -> None:
+    """Sets durations of steps to medians of recorded durations.
+
+    Steps without history are estimated from steps of the same kind for
+    the same config (e.g., builds for other Python versions), or defaults.
+    """
+    similar: dict[str, list[float]] = {}
+    for step_id, durations in history.items():
+        similar.setdefault(_config_of(step_id), []).extend(durations)
+    for step_id, step in steps.items():
+        if step_id in history:
+            step['duration'] = statistics.median(history[step_id])
+            step['estimate'] = 'history'
+        elif step['kind'] != 'image' and _config_of(step_id) in similar:
+            step['duration'] = statistics.median(similar[_config_of(step_id)])
+            step['estimate'] = 'similar'
+        else:
+            step['duration'] = _DEFAULT_DURATIONS[step['kind']]
+            step['estimate'] = 'default'
+
+
+def _dependents(steps: Mapping[str, Step]) -> dict[str, list[str]]:
+    dependents: dict[str, list[str]] = {x: [] for x in steps}
+    for step_id, step in steps.items():
+        for dep in step['deps']:
+            dependents[dep].append(step_id)
+    return dependents
+
+
+def _bottom_levels(steps: Mapping[str, Step]) -> dict[str, float]:
+    """Returns the longest duration from each step to the end."""
+    dependents = _dependents(steps)
+    levels: dict[str, float] = {}
+    for step_id in reversed(list(steps)):
+        levels[step_id] = steps[step_id]['duration'] + max(
+            (levels[x] for x in dependents[step_id]), default=0)
+    return levels
+
+
+def critical_path(steps: Mapping[str, Step]) -> list[str]:
+    """Returns the longest chain of steps in the DAG."""
+    levels = _bottom_levels(steps)
+    dependents = _dependents(steps)
+    roots = [x for x in steps if len(steps[x]['deps']) == 0]
+    if len(roots) == 0:
+        return []
+    path = [max(roots, key=lambda x: levels[x])]
+    while len(dependents[path[-1]]) != 0:
+        path.append(max(dependents[path[-1]], key=lambda x: levels[x]))
+    return path
+
+
+def simulate(
+    steps: Mapping[str, Step], jobs: int | None, verify_jobs: int | None = 1
+) -> tuple[float, int]:
+    """Simulates the schedule of steps.
+
+    Steps in the build pool run on `jobs` workers, and steps in the pool of
+    each distribution run on `verify_jobs` workers (see `build_plan`);
+    workers are unlimited if None.  Ready steps are started in descending
+    order of their bottom levels (critical-path-first) as long as their
+    pools have idle workers.  Returns the estimated makespan and the peak
+    number of steps running in the build pool.
+    """
+    levels = _bottom_levels(steps)
+    dependents = _dependents(steps)
+    waiting = {x: len(steps[x]['deps']) for x in steps}
+    ready = [(-levels[x], x) for x in steps if waiting[x] == 0]
+    heapq.heapify(ready)
+    running: list[tuple[float, str]] = []
+    busy: dict[str | None, int] = {}
+    now = 0.0
+    peak = 0
+    while len(ready) != 0 or len(running) != 0:
+        deferred = []
+        while len(ready) != 0:
+            item = heapq.heappop(ready)
+            pool = steps[item[1]]['pool']
+            limit = (None if pool is None else
+                     jobs if pool == 'build' else verify_jobs)
+            if limit is not None and limit <= busy.get(pool, 0):
+                deferred.append(item)
+                continue
+            busy[pool] = busy.get(pool, 0) + 1
+            heapq.heappush(
+                running, (now + steps[item[1]]['duration'], item[1]))
+        for item in deferred:
+            heapq.heappush(ready, item)
+        peak = max(peak, busy.get('build', 0))
+        now, step_id = heapq.heappop(running)
+        busy[steps[step_id]['pool']] -= 1
+        for dependent in dependents[step_id]:
+            waiting[dependent] -= 1
+            if waiting[dependent] == 0:
+                heapq.heappush(ready, (-levels[dependent], dependent))
+    return now, peak
+
+
+def suggest_workers(
+    makespan: Callable[[int], float], limit: int, min_gain: float = 0.05
+) -> int:
+    """Returns the number of workers at the knee of the makespan curve.
+
+    Workers are added one by one (up to `limit`) while the makespan
+    (computed by `makespan` for the number of workers) decreases by at least
+    `min_gain` of the current one.
+    """
+    workers = 1
+    current = makespan(workers)
+    while workers < limit:
+        next_makespan = makespan(workers + 1)
+        if current - next_makespan < current * min_gain:
+            break
+        workers += 1
+        current = next_makespan
+    return workers
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours}:{minutes:02d}:{seconds:02d}'
+
+
+def export_plan(path: str, steps: Mapping[str, Step]) -> None:
+    """Exports the plan as JSON (or Graphviz DOT if `path` is `*.dot`)."""
+    path_ids = set(critical_path(steps))
+    with open(path, 'w', encoding='UTF-8') as f:
+        if not path.endswith('.dot'):
+            json.dump({
+                'steps': steps,
+                'critical_path': critical_path(steps),
+            }, f, indent=1)
+            return
+        f.write('digraph release {\n  rankdir=LR;\n')
+        for step_id, step in steps.items():
+            label = (f'{step["label"]}\n{format_duration(step["duration"])}'
+                     f' ({step["estimate"]})')
+            attrs = ' color=red' if step_id in path_ids else ''
+            f.write(f'  {json.dumps(step_id)} '
+                    f'[label={json.dumps(label)} shape=box{attrs}];\n')
+            f.writelines(
+                f'  {json.dumps(dep)} -> {json.dumps(step_id)};\n'
+                for dep in step['deps'])
+        f.write('}\n')
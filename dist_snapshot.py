@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import errno
+import os
+import shutil
+import subprocess
+import sys
+from typing import Literal
+
+from dist_cache import tree_digest
+
+SnapshotMode = Literal['auto', 'reflink', 'hardlink', 'copy']
+SNAPSHOT_MODES: tuple[SnapshotMode, ...] = (
+    'auto', 'reflink', 'hardlink', 'copy')
+
+# ioctl request number of FICLONE (`_IOW(0x94, 9, int)`) on Linux.
+_FICLONE = 0x40049409
+
+# errno values indicating that reflink/hardlink is not available for the
+# pair of files (e.g., different filesystems, unsupported filesystem).
+_UNSUPPORTED_ERRNOS = {
+    errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.EPERM,
+    errno.EMLINK,
+}
+
+
+def list_source_files(source: str) -> list[str] | None:
+    """Lists files tracked by git in the source tree (including submodules).
+
+    Returns paths relative to `source`, or None if `source` is not a git
+    working tree.  Untracked and ignored files are not included.
+    """
+    if not os.path.exists(os.path.join(source, '.git')):
+        return None
+    output = subprocess.check_output(
+        ['git', 'ls-files', '-z', '--cached', '--recurse-submodules'],
+        cwd=source)
+    return sorted({
+        os.fsdecode(x) for x in output.split(b'\0') if len(x) != 0})
+
+
+def list_modified_files(source: str) -> list[str]:
+    """Lists tracked files modified in the source tree."""
+    output = subprocess.check_output(
+        ['git', 'status', '--porcelain', '--untracked-files=no',
+         '--ignore-submodules=none'],
+        cwd=source, encoding='UTF-8')
+    return [line[3:] for line in output.splitlines()]
+
+
+def fingerprint_source_tree(source: str, mode: SnapshotMode = 'auto') -> str:
+    """Returns a digest of files included in the snapshot of the source."""
+    files = None if mode == 'copy' else list_source_files(source)
+    return tree_digest(source, files)
+
+
+def _reflink(src: str, dst: str) -> None:
+    import fcntl
+
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.unlink(dst)
+            raise
+    shutil.copystat(src, dst)
+
+
+def snapshot_source_tree(
+    source: str, dest: str, mode: SnapshotMode = 'auto'
+) -> dict[str, int]:
+    """Creates a snapshot of the source tree at `dest`.
+
+    Only files tracked by git are included in the snapshot so that it looks
+    like a clean checkout even if the source tree contains build products.
+    Files are shared with the source tree using reflinks (copy-on-write) if
+    the filesystem supports it (`auto` or `reflink`), or hardlinks
+    (`hardlink`), and copied otherwise.  As hardlinks share the content with
+    the source tree, the snapshot must not be modified in-place in the
+    `hardlink` mode.  In the `copy` mode, or if the source tree is not a
+    git working tree, the whole directory is copied.
+
+    Returns the number of files snapshotted by each method (empty if the
+    whole directory is copied).
+    """
+    files = None if mode == 'copy' else list_source_files(source)
+    if files is None:
+        shutil.copytree(source, dest, symlinks=True)
+        return {}
+
+    stats = {'reflink': 0, 'hardlink': 0, 'copy': 0, 'symlink': 0}
+    method: Literal['reflink', 'hardlink', 'copy'] = 'copy'
+    if mode == 'hardlink':
+        method = 'hardlink'
+    elif mode in ('auto', 'reflink') and sys.platform == 'linux':
+        method = 'reflink'
+
+    os.makedirs(dest)
+    created = {dest}
+    for path in files:
+        src = os.path.join(source, path)
+        dst = os.path.join(dest, path)
+        parent = os.path.dirname(dst)
+        if parent not in created:
+            os.makedirs(parent, exist_ok=True)
+            created.add(parent)
+        if os.path.islink(src):
+            os.symlink(os.readlink(src), dst)
+            stats['symlink'] += 1
+            continue
+        if not os.path.isfile(src):
+            # Tracked but removed from the working tree, or an uninitialized
+            # submodule.
+            continue
+        if method == 'reflink':
+            try:
+                _reflink(src, dst)
+                stats['reflink'] += 1
+                continue
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED_ERRNOS:
+                    raise
+                # Filesystem does not support reflinks; fallback to copy.
+                method = 'copy'
+        elif method == 'hardlink':
+            try:
+                os.link(src, dst)
+                stats['hardlink'] += 1
+                continue
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED_ERRNOS:
+                    raise
+                method = 'copy'
+        shutil.copy2(src, dst)
+        stats['copy'] += 1
+    return stats
+
+
+def get_source_date_epoch(source: str) -> int | None:
+    """Returns the commit time of HEAD of the source tree.
+
+    The time is used as `SOURCE_DATE_EPOCH` for reproducible builds.
+    Returns None if `source` is not a git working tree.
+    """
+    if not os.path.exists(os.path.join(source, '.git')):
+        return None
+    output = subprocess.check_output(
+        ['git', 'log', '-1', '--format=%ct'], cwd=source, encoding='UTF-8')
+    return int(output.strip())
@@ -0,0 +1,108 @@
+"""
+Timeline trace of the release process.
+
+Spans are recorded in the Chrome trace event format, which can be viewed
+with Perfetto (https://ui.perfetto.dev/) or `chrome://tracing`.  Agents
+running in containers write their own events (see `_run` of each agent),
+which are merged into the trace as separate processes.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+
+# Process ID of the controller in the trace; merged agents are numbered
+# from 1.
+_CONTROLLER_PID = 0
+
+_lock = threading.Lock()
+_events: list[dict[str, Any]] = []
+_threads: dict[int, str] = {}
+_processes: dict[int, str] = {_CONTROLLER_PID: 'dist.py'}
+
+
+def _now() -> int:
+    """Returns the current time in microseconds."""
+    return time.time_ns() // 1000
+
+
+def _add(event: dict[str, Any]) -> None:
+    thread = threading.current_thread()
+    event['pid'] = _CONTROLLER_PID
+    event['tid'] = thread.ident
+    with _lock:
+        _threads.setdefault(event['tid'], thread.name)
+        _events.append(event)
+
+
+@contextmanager
+def trace_span(name: str, cat: str, **args: Any) -> Iterator[dict[str, Any]]:
+    """Records the duration of the context as a span.
+
+    Yields a dict of arguments of the span, which can be updated to record
+    results (e.g., exit code).
+    """
+    span_args = dict(args)
+    start = _now()
+    try:
+        yield span_args
+    except BaseException as e:
+        span_args.setdefault('error', repr(e))
+        raise
+    finally:
+        _add({
+            'name': name, 'cat': cat, 'ph': 'X',
+            'ts': start, 'dur': _now() - start, 'args': span_args,
+        })
+
+
+def trace_instant(name: str, cat: str, **args: Any) -> None:
+    """Records an instant event."""
+    _add({
+        'name': name, 'cat': cat, 'ph': 'i', 's': 't',
+        'ts': _now(), 'args': args,
+    })
+
+
+def merge_trace(path: str, process_name: str) -> list[dict[str, Any]]:
+    """Merges events written by an agent as a separate process.
+
+    Returns the events merged.  Does nothing if the file does not exist
+    (e.g., the agent failed to start).
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='UTF-8') as f:
+        events: list[dict[str, Any]] = json.load(f)
+    with _lock:
+        pid = len(_processes)
+        _processes[pid] = process_name
+        for event in events:
+            event['pid'] = pid
+            event.setdefault('tid', 0)
+            _events.append(event)
+    return events
+
+
+def write_trace(path: str) -> None:
+    """Writes all events recorded so far to the file."""
+    with _lock:
+        events = [
+            *({'name': 'process_name', 'ph': 'M', 'pid': pid,
+               'args': {'name': name}} for pid, name in _processes.items()),
+            *({'name': 'thread_name', 'ph': 'M', 'pid': _CONTROLLER_PID,
+               'tid': tid, 'args': {'name': name}}
+              for tid, name in _threads.items()),
+            *_events,
+        ]
+    with open(f'{path}.tmp', 'w', encoding='UTF-8') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    os.replace(f'{path}.tmp', path)
@@ -0,0 +1,464 @@
+"""
+Validation, size analysis and reproducible rewriting of built
+distributions.
+
+The distribution is validated in-process without being extracted, so that
+broken distributions are detected right after the build instead of after
+the verification.  This covers what `twine check --strict` does (rendering
+the long description), plus the integrity of wheels against their RECORD.
+"""
+from __future__ import annotations
+
+import base64
+import csv
+import email.parser
+import hashlib
+import io
+import itertools
+import os
+import re
+import struct
+import tarfile
+import time
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Any
+
+import readme_renderer.rst
+import readme_renderer.txt
+from packaging.utils import InvalidWheelFilename, parse_wheel_filename
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Mapping
+    from email.message import Message
+
+
+def _parse_metadata(metadata: str) -> Message:
+    return email.parser.Parser().parsestr(metadata)
+
+
+def _check_long_description(name: str, metadata: Message) -> None:
+    """Checks that the long description renders (as PyPI does)."""
+    description = metadata.get_payload()
+    assert isinstance(description, str)
+    if description.strip() == '':
+        description = metadata.get('Description', '')
+    if description.strip() == '':
+        raise RuntimeError(f'{name}: long description is missing')
+    content_type = metadata.get('Description-Content-Type')
+    if content_type is None:
+        raise RuntimeError(
+            f'{name}: Description-Content-Type is missing')
+
+    warnings = io.StringIO()
+    if content_type.startswith('text/x-rst'):
+        rendered = readme_renderer.rst.render(description, stream=warnings)
+    elif content_type.startswith('text/markdown'):
+        # Imported lazily as it warns if Markdown renderers are unavailable.
+        from readme_renderer.markdown import render as render_markdown
+        rendered = render_markdown(description)
+    elif content_type.startswith('text/plain'):
+        rendered = readme_renderer.txt.render(description)
+    else:
+        raise RuntimeError(
+            f'{name}: unknown Description-Content-Type: {content_type}')
+    if rendered is None or warnings.getvalue() != '':
+        raise RuntimeError(
+            f'{name}: long description failed to render:\n'
+            f'{warnings.getvalue()}')
+
+
+def _record_digest(algorithm: str, digest: bytes) -> str:
+    encoded = base64.urlsafe_b64encode(digest).rstrip(b'=').decode()
+    return f'{algorithm}={encoded}'
+
+
+def check_dist(path: str, asset_name: str) -> None:
+    """Checks the distribution (wheel or sdist).
+
+    Raises RuntimeError if the distribution is broken.
+    """
+    if asset_name.endswith('.whl'):
+        check_wheel(path, asset_name)
+    elif asset_name.endswith('.tar.gz'):
+        check_sdist(path)
+    else:
+        raise ValueError(f'unknown distribution format: {asset_name}')
+
+
+def check_wheel(path: str, expected_name: str) -> None:
+    """Checks the wheel.
+
+    Members are streamed once to verify their hashes and sizes against the
+    RECORD.  Tags in the WHEEL file are checked against `expected_name`,
+    the file name of the wheel (before renamed to manylinux) as generated
+    by `dist_utils.wheel_name`.
+    """
+    m = re.fullmatch(
+        r'(?P<distribution>[^-]+)-(?P<version>[^-]+)-'
+        r'(?P<tags>[^-]+-[^-]+-[^-]+)\.whl', expected_name)
+    assert m is not None, expected_name
+    dist_info = f'{m["distribution"]}-{m["version"]}.dist-info'
+
+    with zipfile.ZipFile(path) as z:
+        try:
+            record_data = z.read(f'{dist_info}/RECORD').decode('UTF-8')
+            wheel_data = z.read(f'{dist_info}/WHEEL').decode('UTF-8')
+            metadata_data = z.read(f'{dist_info}/METADATA').decode('UTF-8')
+        except KeyError as e:
+            raise RuntimeError(f'{path}: {e}') from e
+
+        # Check tags.
+        tags = _parse_metadata(wheel_data).get_all('Tag', [])
+        if tags != [m['tags']]:
+            raise RuntimeError(
+                f'{path}: tags in WHEEL {tags} do not match the expected '
+                f'tag ({m["tags"]})')
+
+        # Check hashes and sizes of members.
+        record = {}
+        for row in csv.reader(io.StringIO(record_data)):
+            if len(row) == 0:
+                continue
+            filename, digest, size = row
+            record[filename] = (digest, size)
+        for info in z.infolist():
+            if info.is_dir():
+                continue
+            if info.filename not in record:
+                raise RuntimeError(
+                    f'{path}: {info.filename} is not listed in RECORD')
+            digest, size = record.pop(info.filename)
+            if digest == '':
+                # RECORD itself.
+                continue
+            algorithm = digest.split('=', 1)[0]
+            if algorithm not in {'sha256', 'sha384', 'sha512'}:
+                raise RuntimeError(
+                    f'{path}: unsupported hash for {info.filename}: {digest}')
+            h = hashlib.new(algorithm)
+            actual_size = 0
+            # Note that CRC is also checked while reading.
+            with z.open(info) as f:
+                while chunk := f.read(1024 * 1024):
+                    h.update(chunk)
+                    actual_size += len(chunk)
+            actual_digest = _record_digest(algorithm, h.digest())
+            if actual_digest != digest or str(actual_size) != size:
+                raise RuntimeError(
+                    f'{path}: {info.filename} does not match RECORD '
+                    f'(expected {digest}, {size} bytes; '
+                    f'got {actual_digest}, {actual_size} bytes)')
+        if len(record) != 0:
+            raise RuntimeError(
+                f'{path}: files listed in RECORD are missing: '
+                f'{", ".join(sorted(record))}')
+
+    _check_long_description(path, _parse_metadata(metadata_data))
+
+
+def check_sdist(path: str) -> None:
+    """Checks the sdist."""
+    with tarfile.open(path) as t:
+        member = next(
+            (x for x in t.getmembers()
+             if re.fullmatch(r'[^/]+/PKG-INFO', x.name)), None)
+        if member is None:
+            raise RuntimeError(f'{path}: PKG-INFO is missing')
+        f = t.extractfile(member)
+        assert f is not None
+        metadata = f.read().decode('UTF-8')
+    _check_long_description(path, _parse_metadata(metadata))
+
+
+def _size_group(filename: str) -> str:
+    """Returns the name of the group of the wheel member for size reports.
+
+    Extension modules form their own groups (e.g., `cupy._core.core`);
+    other files are grouped by their directory.
+    """
+    m = re.fullmatch(
+        r'(?P<module>[^.]+)\.(cpython-[^/]+|abi3)\.(so|pyd)', filename)
+    if m is None:
+        m = re.fullmatch(r'(?P<module>[^.]+)\.pyd', filename)
+    if m is not None:
+        return m['module'].replace('/', '.')
+    dirname = filename.rpartition('/')[0]
+    return f'{dirname or "."}/*'
+
+
+def wheel_size_report(path: str, name: str | None = None) -> dict[str, Any]:
+    """Returns the report of sizes of the wheel.
+
+    The report contains the name (`name` if given, otherwise the basename of
+    `path`) and the size of the wheel file, and the compressed and
+    uncompressed sizes of each member and each group of members (see
+    `_size_group`).
+    """
+    members: dict[str, list[int]] = {}
+    groups: dict[str, dict[str, int]] = {}
+    with zipfile.ZipFile(path) as z:
+        for info in z.infolist():
+            if info.is_dir():
+                continue
+            members[info.filename] = [info.compress_size, info.file_size]
+            group = groups.setdefault(_size_group(info.filename), {
+                'files': 0, 'compressed': 0, 'uncompressed': 0})
+            group['files'] += 1
+            group['compressed'] += info.compress_size
+            group['uncompressed'] += info.file_size
+    return {
+        'wheel': name if name is not None else os.path.basename(path),
+        'size': os.path.getsize(path),
+        'groups': groups,
+        'members': members,
+    }
+
+
+def find_size_baseline(directory: str, wheel: str) -> str | None:
+    """Returns the path to the baseline for the wheel in the directory.
+
+    The baseline is a wheel or a size report (`*.whl.size.json`) of the same
+    project, Python tag and platform tag as `wheel` (a filename), ignoring
+    the version.  The latest version is used if there are multiple, and a
+    size report is preferred to a wheel of the same version.
+    """
+    name, _, _, tags = parse_wheel_filename(wheel)
+    candidates = []
+    for filename in os.listdir(directory):
+        wheel_filename = filename.removesuffix('.size.json')
+        if not wheel_filename.endswith('.whl'):
+            continue
+        try:
+            x_name, x_version, _, x_tags = parse_wheel_filename(
+                wheel_filename)
+        except InvalidWheelFilename:
+            continue
+        if x_name == name and x_tags == tags:
+            candidates.append(
+                (x_version, filename.endswith('.size.json'), filename))
+    if len(candidates) == 0:
+        return None
+    return os.path.join(directory, max(candidates)[2])
+
+
+def _format_size(size: int) -> str:
+    return f'{size / 1024 ** 2:.2f} MiB'
+
+
+def _format_delta(size: int, baseline: int | None) -> str:
+    if baseline is None:
+        return '(new)'
+    delta = size - baseline
+    if baseline == 0:
+        return f'({delta:+d} B)'
+    return f'({delta / 1024 ** 2:+.2f} MiB, {delta / baseline:+.1%})'
+
+
+def format_size_report(
+    report: Mapping[str, Any],
+    baseline: Mapping[str, Any] | None,
+    top: int = 20,
+) -> list[str]:
+    """Returns lines summarizing the size report.
+
+    Groups are listed in descending order of the compressed size (up to
+    `top` groups, plus groups changed from the baseline if given).
+    """
+    line = f'Wheel size: {_format_size(report["size"])}'
+    if baseline is not None:
+        line += f' {_format_delta(report["size"], baseline["size"])}'
+    lines = [line]
+    base_groups = baseline['groups'] if baseline is not None else {}
+    groups = sorted(
+        report['groups'].items(), key=lambda x: (-x[1]['compressed'], x[0]))
+    for i, (name, group) in enumerate(groups):
+        base = base_groups.get(name)
+        changed = (
+            baseline is not None and
+            (base is None or base['compressed'] != group['compressed']))
+        if top <= i and not changed:
+            continue
+        line = (
+            f'  {name}: {_format_size(group["compressed"])} compressed, '
+            f'{_format_size(group["uncompressed"])} uncompressed '
+            f'({group["files"]} files)')
+        if baseline is not None:
+            line += ' ' + _format_delta(
+                group['compressed'],
+                base['compressed'] if base is not None else None)
+        lines.append(line)
+    for name in sorted(set(base_groups) - set(report['groups'])):
+        lines.append(
+            f'  {name}: removed '
+            f'(-{_format_size(base_groups[name]["compressed"])})')
+    return lines
+
+
+def _wheel_member_order(filename: str) -> tuple[int, str]:
+    """Returns the sort key of the member in wheels written by this module.
+
+    `.dist-info` directory is placed at the end of the archive with RECORD
+    being the last, as recommended by the wheel specification.
+    """
+    top = filename.split('/', 1)[0]
+    if not top.endswith('.dist-info'):
+        return (0, filename)
+    if filename == f'{top}/RECORD':
+        return (2, filename)
+    return (1, filename)
+
+
+# Values at or above which ZIP64 extensions are used.  The fields are then
+# set to the maximum values (0xFFFFFFFF or 0xFFFF) as marks.
+_ZIP64_LIMIT = 0xFFFFFFFF
+_ZIP64_COUNT_LIMIT = 0xFFFF
+
+
+def _zip_field(value: int) -> int:
+    """Returns the value of the 32-bit field, or the mark of ZIP64."""
+    return 0xFFFFFFFF if _ZIP64_LIMIT <= value else value
+
+
+def _deflate_member(
+    path: str, filename: str, level: int
+) -> tuple[bytes, int, int]:
+    """Compresses the member of the zip file with raw Deflate.
+
+    Returns the compressed data, the compression method (the data is stored
+    as is if not compressible) and CRC-32.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    compressed = io.BytesIO()
+    crc = 0
+    size = 0
+    with zipfile.ZipFile(path) as z:
+        with z.open(filename) as f:
+            while chunk := f.read(1024 * 1024):
+                crc = zlib.crc32(chunk, crc)
+                size += len(chunk)
+                compressed.write(compressor.compress(chunk))
+        compressed.write(compressor.flush())
+        if size <= compressed.tell():
+            return z.read(filename), zipfile.ZIP_STORED, crc
+    return compressed.getvalue(), zipfile.ZIP_DEFLATED, crc
+
+
+def _write_zip(
+    path: str,
+    members: Iterable[tuple[zipfile.ZipInfo, bytes, int, int]],
+) -> None:
+    """Writes the zip file from members already compressed.
+
+    `members` is a sequence of `(info, data, method, crc)`, where `data` is
+    compressed with `method`.  Only `filename`, `date_time`, `file_size`,
+    `create_system` and `external_attr` of `info` are used, and no extra
+    fields other than ZIP64 ones are written, so that the output only
+    depends on the members.  ZIP64 extensions are used only where sizes,
+    offsets or the number of members exceed limits of ZIP.
+    """
+    central_directory = []
+    count = 0
+    with open(path, 'wb') as f:
+        for info, data, method, crc in members:
+            offset = f.tell()
+            name = info.filename.encode('UTF-8')
+            flags = 0 if info.filename.isascii() else 0x800
+            year, month, day, hour, minute, second = info.date_time
+            dos_date = (year - 1980) << 9 | month << 5 | day
+            dos_time = hour << 11 | minute << 5 | second // 2
+
+            # The local header must have both sizes in ZIP64 extra field if
+            # either of them is too large.
+            zip64 = _ZIP64_LIMIT <= max(len(data), info.file_size)
+            version = 45 if zip64 else 20
+            local_extra = b''
+            if zip64:
+                local_extra = struct.pack(
+                    '<HHQQ', 0x0001, 16, info.file_size, len(data))
+            f.write(struct.pack(
+                '<IHHHHHIIIHH', 0x04034B50, version, flags, method,
+                dos_time, dos_date, crc,
+                0xFFFFFFFF if zip64 else len(data),
+                0xFFFFFFFF if zip64 else info.file_size,
+                len(name), len(local_extra)))
+            f.write(name)
+            f.write(local_extra)
+            f.write(data)
+
+            # The central header only has fields too large in the extra
+            # field, in the order of uncompressed size, compressed size and
+            # offset.
+            fields = []
+            for value in (info.file_size, len(data), offset):
+                if _ZIP64_LIMIT <= value:
+                    fields.append(value)
+            extra = b''
+            if len(fields) != 0:
+                version = 45
+                extra = struct.pack(
+                    f'<HH{len(fields)}Q', 0x0001, 8 * len(fields), *fields)
+            central_directory.append(struct.pack(
+                '<IHHHHHHIIIHHHHHII', 0x02014B50,
+                info.create_system << 8 | version, version, flags, method,
+                dos_time, dos_date, crc, _zip_field(len(data)),
+                _zip_field(info.file_size), len(name), len(extra), 0, 0, 0,
+                info.external_attr, _zip_field(offset)) + name + extra)
+            count += 1
+
+        offset = f.tell()
+        f.writelines(central_directory)
+        size = f.tell() - offset
+        if (_ZIP64_COUNT_LIMIT <= count or _ZIP64_LIMIT <= offset or
+                _ZIP64_LIMIT <= size):
+            end = f.tell()
+            # ZIP64 end of central directory record and its locator.
+            f.write(struct.pack(
+                '<IQHHIIQQQQ', 0x06064B50, 44, 45, 45, 0, 0, count, count,
+                size, offset))
+            f.write(struct.pack('<IIQI', 0x07064B50, 0, end, 1))
+        f.write(struct.pack(
+            '<IHHHHIIH', 0x06054B50, 0, 0,
+            *[0xFFFF if _ZIP64_COUNT_LIMIT <= count else count] * 2,
+            _zip_field(size), _zip_field(offset), 0))
+
+
+def rewrite_wheel(
+    path: str, jobs: int, level: int, epoch: int | None = None
+) -> int:
+    """Rewrites the wheel in-place in a reproducible layout.
+
+    Members are compressed in parallel by `jobs` processes with the given
+    compression level, and written in a deterministic order (see
+    `_wheel_member_order`) with normalized permissions (0644, or 0755 for
+    executables).  If `epoch` (`SOURCE_DATE_EPOCH`) is given, timestamps of
+    members are set to it.  Contents of members are unchanged, thus the
+    RECORD stays consistent.  Returns the number of bytes saved.
+    """
+    if epoch is not None:
+        # ZIP timestamps cannot represent dates before 1980.
+        date_time = time.gmtime(max(epoch, 315532800))[:6]
+    with zipfile.ZipFile(path) as z:
+        infos = []
+        for x in sorted(
+                (x for x in z.infolist() if not x.is_dir()),
+                key=lambda x: _wheel_member_order(x.filename)):
+            info = zipfile.ZipInfo(
+                x.filename, x.date_time if epoch is None else date_time)
+            info.create_system = 3  # Unix
+            info.external_attr = (
+                0o100755 if (x.external_attr >> 16) & 0o111 else 0o100644
+            ) << 16
+            info.file_size = x.file_size
+            infos.append(info)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        results = executor.map(
+            _deflate_member, itertools.repeat(path),
+            [x.filename for x in infos], itertools.repeat(level))
+        _write_zip(f'{path}.tmp', (
+            (info, data, method, crc)
+            for info, (data, method, crc) in zip(infos, results)))
+    saved = os.path.getsize(path) - os.path.getsize(f'{path}.tmp')
+    os.replace(f'{path}.tmp', path)
+    return saved
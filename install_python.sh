@@ -0,0 +1,127 @@
+#!/bin/bash -uex
+
+# Usage: install_python.sh "<pyenv versions>" [pip install arguments...]
+#
+# Installs the Python versions with pyenv, then installs the Python
+# libraries to each of them in parallel.
+#
+# If the toolchain cache directory (${PYTHON_CACHE}) is available (mounted
+# as a BuildKit cache), interpreters are restored from tarballs in the
+# cache instead of being compiled from source.  Tarballs are keyed by the
+# pyenv version, the content of its pyenv build definition, the OS release,
+# the architecture, the build flags and versions of development packages of
+# libraries Python links to, as modules are silently skipped if they are
+# missing (e.g., `readline` is not installed in all images).
+#
+# This file is shared between builder and verifier, and copied into their
+# Docker build contexts by `dist.py`.
+
+PYTHON_VERSIONS=$1
+shift
+
+PYTHON_CACHE="${PYTHON_CACHE:-/python-cache}"
+
+. /etc/os-release
+OS_RELEASE="${ID}${VERSION_ID:-}-$(uname -m)"
+
+# Versions of development packages installed for libraries Python links to.
+dev_packages() {
+    if command -v rpm > /dev/null; then
+        rpm -q bzip2-devel openssl-devel openssl11-devel readline-devel \
+            libffi-devel zlib-devel sqlite-devel xz-devel ncurses-devel \
+            gdbm-devel tk-devel libuuid-devel expat-devel || true
+    elif command -v dpkg-query > /dev/null; then
+        dpkg-query -W -f '${Package}=${Version}\n' \
+            libbz2-dev libssl-dev libreadline-dev libffi-dev zlib1g-dev \
+            libsqlite3-dev liblzma-dev libncurses5-dev libncursesw5-dev \
+            libgdbm-dev tk-dev uuid-dev libexpat1-dev 2> /dev/null || true
+    fi
+}
+
+DEV_PACKAGES="$(dev_packages)"
+
+cache_key() {
+    local version=$1
+    local definition="${PYENV_ROOT}/plugins/python-build/share/python-build/${version}"
+    local digest="$(
+        ( cat "${definition}" &&
+          echo "${CFLAGS:-}|${CPPFLAGS:-}|${LDFLAGS:-}" &&
+          echo "${DEV_PACKAGES}" ) |
+        sha256sum | cut -c 1-16)"
+    echo "python-${version}-${OS_RELEASE}-${digest}"
+}
+
+install_python() {
+    local version=$1
+    local prefix="${PYENV_ROOT}/versions/${version}"
+    if [ ! -d "${PYTHON_CACHE}" ]; then
+        pyenv install "${version}"
+        return
+    fi
+
+    local tarball="${PYTHON_CACHE}/$(cache_key "${version}").tar.gz"
+    if [ -f "${tarball}" ] && \
+            ( cd "${PYTHON_CACHE}" && sha256sum --quiet -c "${tarball}.sha256" ); then
+        echo "Restoring Python ${version} from cache: ${tarball}"
+        mkdir -p "${prefix}"
+        tar -xzf "${tarball}" -C "${prefix}"
+        touch "${tarball}"
+        return
+    fi
+
+    pyenv install "${version}"
+    echo "Saving Python ${version} to cache: ${tarball}"
+    # Write to a temporary file first as the cache may be shared among
+    # concurrent builds.
+    local tmp="${tarball}.$$.tmp"
+    tar -czf "${tmp}" -C "${prefix}" .
+    mv "${tmp}" "${tarball}"
+    ( cd "${PYTHON_CACHE}" && sha256sum "$(basename "${tarball}")" ) > "${tmp}"
+    mv "${tmp}" "${tarball}.sha256"
+}
+
+# Wait for all the background jobs and fail if any of them failed.
+wait_all() {
+    local status=0
+    local pid
+    for pid in "$@"; do
+        wait "${pid}" || status=1
+    done
+    return "${status}"
+}
+
+# Install Python.
+PIDS=()
+for VERSION in ${PYTHON_VERSIONS}; do
+    install_python "${VERSION}" &
+    PIDS+=($!)
+done
+wait_all "${PIDS[@]}"
+pyenv rehash
+
+# Install Python libraries.
+PIDS=()
+for VERSION in ${PYTHON_VERSIONS}; do
+    (
+        export PYENV_VERSION="${VERSION}"
+        pyenv exec pip install -U pip setuptools
+        if [ $# -ne 0 ]; then
+            pyenv exec pip install "$@"
+        fi
+    ) > "/tmp/pip-install-${VERSION}.log" 2>&1 &
+    PIDS+=($!)
+done
+STATUS=0
+wait_all "${PIDS[@]}" || STATUS=$?
+for VERSION in ${PYTHON_VERSIONS}; do
+    echo "Installing libraries on Python ${VERSION}..."
+    cat "/tmp/pip-install-${VERSION}.log"
+    rm "/tmp/pip-install-${VERSION}.log"
+done
+if [ "${STATUS}" -ne 0 ]; then
+    echo "Failed to install libraries"
+    exit "${STATUS}"
+fi
+
+# The last version installed will be used to run the agent.
+pyenv global "${VERSION}"
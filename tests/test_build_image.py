@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import json
+import os
+import stat
+import sys
+from typing import TYPE_CHECKING, Any
+
+import pytest
+
+from dist import Controller
+
+if TYPE_CHECKING:
+    import pathlib
+
+
+# Fake `docker` command; images are kept in `$FAKE_DOCKER_STATE` as a map
+# from names to their IDs and labels, and invocations are appended to
+# `$FAKE_DOCKER_LOG`.
+_FAKE_DOCKER = """\
+import json
+import os
+import sys
+
+args = sys.argv[1:]
+with open(os.environ['FAKE_DOCKER_LOG'], 'a') as f:
+    f.write(json.dumps(args) + '\\n')
+with open(os.environ['FAKE_DOCKER_STATE']) as f:
+    images = json.load(f)
+if args[:2] == ['image', 'inspect']:
+    image = images.get(args[-1])
+    if image is None:
+        sys.exit('Error: No such image: ' + args[-1])
+    fmt = args[args.index('--format') + 1]
+    if fmt == '{{.Id}}':
+        print(image['id'])
+    else:
+        print(next(
+            (v for k, v in image['labels'].items() if k in fmt),
+            '<no value>'))
+elif args[0] == 'pull':
+    if os.environ.get('FAKE_DOCKER_PULL_ID') is None:
+        sys.exit('Error: pull access denied')
+    images[args[-1]] = {
+        'id': os.environ['FAKE_DOCKER_PULL_ID'], 'labels': {}}
+elif args[0] == 'build':
+    labels = dict(
+        args[i + 1].split('=', 1)
+        for i, x in enumerate(args) if x == '--label')
+    images[args[args.index('--tag') + 1]] = {
+        'id': 'sha256:built', 'labels': labels}
+with open(os.environ['FAKE_DOCKER_STATE'], 'w') as f:
+    json.dump(images, f)
+"""
+
+
+class _FakeDocker:
+
+    def __init__(self, path: pathlib.Path) -> None:
+        self.state = path / 'images.json'
+        self.log = path / 'docker.log'
+        self.set_base_image_id('sha256:aaa')
+        self.log.write_text('')
+
+    def set_base_image_id(self, image_id: str) -> None:
+        images = (json.loads(self.state.read_text())
+                  if self.state.exists() else {})
+        images['base:latest'] = {'id': image_id, 'labels': {}}
+        self.state.write_text(json.dumps(images))
+
+    def commands(self) -> list[str]:
+        """Returns subcommands invoked since the last call."""
+        lines = self.log.read_text().splitlines()
+        self.log.write_text('')
+        return [json.loads(x)[0] for x in lines]
+
+
+@pytest.fixture
+def docker(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> _FakeDocker:
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    script = bin_dir / 'docker'
+    script.write_text(f'#!{sys.executable}\n{_FAKE_DOCKER}')
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    fake = _FakeDocker(tmp_path)
+    monkeypatch.setenv('PATH', f'{bin_dir}{os.pathsep}{os.environ["PATH"]}')
+    monkeypatch.setenv('FAKE_DOCKER_STATE', str(fake.state))
+    monkeypatch.setenv('FAKE_DOCKER_LOG', str(fake.log))
+    return fake
+
+
+@pytest.fixture
+def docker_ctx(tmp_path: pathlib.Path) -> str:
+    ctx = tmp_path / 'ctx'
+    ctx.mkdir()
+    (ctx / 'Dockerfile').write_text('ARG base_image\nFROM ${base_image}\n')
+    return str(ctx)
+
+
+def _build_image(docker_ctx: str, **kwargs: Any) -> None:
+    Controller._build_image(
+        'test:latest', docker_ctx, 'Dockerfile',
+        {'base_image': 'base:latest'}, False, **kwargs)
+
+
+def test_build_image_hit(docker: _FakeDocker, docker_ctx: str) -> None:
+    _build_image(docker_ctx)
+    assert 'build' in docker.commands()
+    _build_image(docker_ctx)
+    assert docker.commands() == ['image', 'image']
+
+
+def test_build_image_miss_base_image_updated(
+    docker: _FakeDocker, docker_ctx: str
+) -> None:
+    _build_image(docker_ctx)
+    docker.commands()
+    docker.set_base_image_id('sha256:bbb')
+    _build_image(docker_ctx)
+    assert docker.commands() == ['image', 'image', 'build']
+
+
+def test_build_image_pull_base(
+    docker: _FakeDocker, docker_ctx: str, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    _build_image(docker_ctx)
+    docker.commands()
+    monkeypatch.setenv('FAKE_DOCKER_PULL_ID', 'sha256:aaa')
+    _build_image(docker_ctx, pull_base=True)
+    assert docker.commands() == ['pull', 'image', 'image']
+    monkeypatch.setenv('FAKE_DOCKER_PULL_ID', 'sha256:bbb')
+    _build_image(docker_ctx, pull_base=True)
+    assert docker.commands() == ['pull', 'image', 'image', 'build']
+
+
+def test_build_image_pull_base_failure(
+    docker: _FakeDocker, docker_ctx: str
+) -> None:
+    _build_image(docker_ctx)
+    docker.commands()
+    # Falls back to the local base image.
+    _build_image(docker_ctx, pull_base=True)
+    assert docker.commands() == ['pull', 'image', 'image']
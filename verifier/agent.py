@@ -4,21 +4,38 @@ from __future__ import annotations
 import argparse
 import os
 import shlex
+import shutil
 import subprocess
 import sys
+import tempfile
 import time
+from contextlib import ExitStack
+from typing import Any
+
+from agent_trace import AgentTrace
 
 
 class _VerifierAgentArgs(argparse.Namespace):
-    dist: str | None
-    python: str | None
+    dist: list[str]
+    python: list[str]
     cuda: str | None
     preload: list[str]
+    nccl_version: str | None
+    wheelhouse: str | None
+    constraint: list[str]
+    offline: bool
+    trace: str | None
     chown: str | None
+    shards: int
+    junit_dir: str | None
+    smoke_only: bool
 
 
 class VerifierAgent:
 
+    def __init__(self) -> None:
+        self._trace = AgentTrace()
+
     @staticmethod
     def _log(msg: str) -> None:
         print(f'[VerifierAgent] [{time.asctime()}]: {msg}', flush=True)
@@ -28,43 +45,231 @@ class VerifierAgent:
         env = dict(os.environ)
         if debug_library_load:
             env['CUPY_DEBUG_LIBRARY_LOAD'] = '1'
-        subprocess.check_call(cmd, env=env)
+        with self._trace.span(shlex.join(cmd), 'command') as span:
+            try:
+                subprocess.check_call(cmd, env=env)
+                span['exit_code'] = 0
+            except subprocess.CalledProcessError as e:
+                span['exit_code'] = e.returncode
+                raise
+
+    @staticmethod
+    def _visible_gpus() -> list[str]:
+        """Returns IDs of GPUs visible (NVIDIA GPUs only)."""
+        visible = os.environ.get('CUDA_VISIBLE_DEVICES', None)
+        if visible is not None:
+            return [x for x in visible.split(',') if x != '']
+        try:
+            output = subprocess.check_output(
+                ['nvidia-smi', '--list-gpus'], text=True)
+        except (OSError, subprocess.CalledProcessError):
+            return []
+        return [
+            str(i) for i, line in enumerate(
+                x for x in output.splitlines() if x.startswith('GPU '))
+        ]
+
+    def _run_pytest(
+        self,
+        pycommand: list[str],
+        pytest_args: list[str],
+        shards: int,
+        junit_dir: str | None,
+        junit_name: str = 'junit',
+    ) -> None:
+        """Runs pytest, optionally split into shards run concurrently.
+
+        Each shard runs a subset of tests (see
+        `pytest_plugins/pytest_shard.py`) and is pinned to its own GPU when
+        several GPUs are visible.  If `junit_dir` is given, JUnit XML reports
+        with per-test durations are written to the directory as
+        `<junit_name>[-<shard>].xml`.
+        """
+        cmdline = [*pycommand, '-m', 'pytest', *pytest_args]
+        gpus = self._visible_gpus()
+        if shards == 0:
+            shards = max(len(gpus), 1)
+        if junit_dir is not None:
+            os.makedirs(junit_dir, exist_ok=True)
+        if shards == 1:
+            if junit_dir is not None:
+                cmdline += [f'--junitxml={junit_dir}/{junit_name}.xml']
+            self._run(*cmdline, debug_library_load=True)
+            return
+
+        self._log(f'Running tests in {shards} shards '
+                  f'({len(gpus)} GPU(s) visible)')
+        # Only the directory of pytest plugins is added to the path so that
+        # other files next to the agent are not importable from tests.
+        plugin_dir = os.path.join(
+            os.path.abspath(os.path.dirname(sys.argv[0])), 'pytest_plugins')
+        python_path = os.environ.get('PYTHONPATH', None)
+        procs: list[tuple[subprocess.Popen[bytes], Any]] = []
+        with self._trace.span(
+                f'{shlex.join(cmdline)} ({shards} shards)', 'command'
+        ) as span, ExitStack() as outputs:
+            try:
+                for index in range(shards):
+                    env = dict(os.environ)
+                    env['CUPY_DEBUG_LIBRARY_LOAD'] = '1'
+                    env['CUPY_RELEASE_TEST_SHARD'] = f'{index}/{shards}'
+                    env['PYTHONPATH'] = (
+                        plugin_dir if python_path is None
+                        else f'{plugin_dir}{os.pathsep}{python_path}')
+                    if 1 < len(gpus):
+                        env['CUDA_VISIBLE_DEVICES'] = gpus[index % len(gpus)]
+                    shard_cmdline = [*cmdline, '-p', 'pytest_shard']
+                    if junit_dir is not None:
+                        shard_cmdline += [
+                            f'--junitxml={junit_dir}/{junit_name}-{index}.xml']
+                    self._log(
+                        f'Starting shard {index} '
+                        f'(GPU {env.get("CUDA_VISIBLE_DEVICES", "all")}): '
+                        f'{shlex.join(shard_cmdline)}')
+                    output = outputs.enter_context(tempfile.TemporaryFile())
+                    procs.append((subprocess.Popen(
+                        shard_cmdline, env=env, stdout=output,
+                        stderr=subprocess.STDOUT), output))
+                exit_codes = []
+                for index, (proc, output) in enumerate(procs):
+                    exit_codes.append(proc.wait())
+                    self._log(f'Output of shard {index} '
+                              f'(exit code {proc.returncode}):')
+                    output.seek(0)
+                    sys.stdout.flush()
+                    shutil.copyfileobj(output, sys.stdout.buffer)
+                    sys.stdout.flush()
+            finally:
+                for proc, _ in procs:
+                    if proc.poll() is None:
+                        proc.kill()
+                        proc.wait()
+            # Shards may have no tests (exit code 5) if there are fewer
+            # tests than shards.
+            failed = [x for x in exit_codes if x not in (0, 5)]
+            if len(failed) == 0 and all(x == 5 for x in exit_codes):
+                failed = [5]
+            span['exit_code'] = failed[0] if 0 < len(failed) else 0
+        if 0 < len(failed):
+            raise subprocess.CalledProcessError(failed[0], cmdline)
 
     @staticmethod
     def parse_args() -> tuple[_VerifierAgentArgs, list[str]]:
         parser = argparse.ArgumentParser()
         parser.add_argument(
-            '--dist', type=str,
-            help='Path to the distribution (sdist or wheel)')
+            '--dist', type=str, action='append', default=[],
+            help='Path to the distribution (sdist or wheel); can be '
+                 'specified for multiple times with the same number of '
+                 '--python')
         parser.add_argument(
-            '--python', type=str,
-            help='Python version to use for setup')
+            '--python', type=str, action='append', default=[],
+            help='Python version to use for setup; can be specified for '
+                 'multiple times to verify each --dist with its own Python')
         parser.add_argument(
             '--cuda', type=str,
             help='CUDA version')
         parser.add_argument(
             '--preload', action='append', type=str, default=[],
             help='Install the library and preload')
+        parser.add_argument(
+            '--nccl-version', type=str,
+            help='NCCL version to install when preloading NCCL')
+        parser.add_argument(
+            '--wheelhouse', type=str,
+            help='Path to the directory containing wheels to install')
+        parser.add_argument(
+            '--constraint', type=str, action='append', default=[],
+            help='Path to the constraints file used for pip; if specified, '
+                 'one for each --dist')
+        parser.add_argument(
+            '--offline', action='store_true', default=False,
+            help='Install packages only from the wheelhouse')
+        parser.add_argument(
+            '--trace', type=str,
+            help='Path to write the trace in the Chrome trace event format')
         parser.add_argument(
             '--chown', type=str,
             help='Reset owner of files to the specified `uid:gid`')
+        parser.add_argument(
+            '--shards', type=int, default=1,
+            help='Number of processes to split tests into, each pinned to '
+                 'its own GPU if several GPUs are visible; 0 to run one per '
+                 'GPU')
+        parser.add_argument(
+            '--junit-dir', type=str,
+            help='Path to the directory to write JUnit XML reports to')
+        parser.add_argument(
+            '--smoke-only', action='store_true', default=False,
+            help='Only install the distribution and check that CuPy can be '
+                 'imported with preloading; tests are not run')
 
         return parser.parse_known_args(namespace=_VerifierAgentArgs())
 
     def main(self) -> None:
         args, pytest_args = self.parse_args()
+        try:
+            self._verify(args, pytest_args)
+        finally:
+            if args.trace:
+                self._log(f'Writing trace to: {args.trace}')
+                self._trace.write(args.trace)
+
+    def _verify(
+        self, args: _VerifierAgentArgs, pytest_args: list[str]
+    ) -> None:
+        assert len(args.dist) != 0
+        assert len(args.python) in (0, len(args.dist))
+        assert len(args.constraint) in (0, len(args.dist))
+
+        # Configure pip via environment variables so that they also take
+        # effect in `setup_cuda_runtime_headers.py`.
+        if args.wheelhouse is not None:
+            self._log(f'Using wheelhouse: {args.wheelhouse}')
+            os.environ['PIP_FIND_LINKS'] = args.wheelhouse
+        if args.offline:
+            self._log('Offline mode; packages are not downloaded')
+            os.environ['PIP_NO_INDEX'] = '1'
+
+        try:
+            for i, dist in enumerate(args.dist):
+                python = args.python[i] if 0 < len(args.python) else None
+                constraint = (
+                    args.constraint[i] if 0 < len(args.constraint) else None)
+                self._verify_dist(args, dist, python, constraint, pytest_args)
+        finally:
+            if args.chown:
+                self._log('Resetting owner/group of the source tree...')
+                self._run('chown', '-R', args.chown, '.')
 
+    def _verify_dist(
+        self,
+        args: _VerifierAgentArgs,
+        dist: str,
+        python: str | None,
+        constraint: str | None,
+        pytest_args: list[str],
+    ) -> None:
         pycommand = [sys.executable]
-        if args.python:
-            os.environ['PYENV_VERSION'] = args.python
-            self._log(f'Using Python {args.python}')
+        if python:
+            os.environ['PYENV_VERSION'] = python
+            self._log(f'Using Python {python}')
             pycommand = ['pyenv', 'exec', 'python']
+            if 1 < len(args.dist):
+                # Isolate packages installed with `--user` from other
+                # Python versions verified in the same container.
+                user_base = os.path.expanduser(f'~/.local-py{python}')
+                self._log(f'Using user site directory: {user_base}')
+                os.environ['PYTHONUSERBASE'] = user_base
         else:
             self._log('Using Python from system')
 
-        assert args.dist is not None
+        if constraint is not None:
+            self._log(f'Using constraints: {constraint}')
+            os.environ['PIP_CONSTRAINT'] = constraint
+        else:
+            os.environ.pop('PIP_CONSTRAINT', None)
 
-        self._log('Installing distribution...')
+        self._log(f'Installing distribution: {dist}')
         cmdline = [
             *pycommand,
             '-m',
@@ -72,7 +277,7 @@ class VerifierAgent:
             'install',
             '-v',
             '--user',
-            args.dist,
+            dist,
         ]
         self._run(*cmdline)
 
@@ -96,12 +301,11 @@ class VerifierAgent:
         for p in args.preload:
             assert args.cuda is not None
             if p == 'nccl':
+                assert args.nccl_version is not None
                 self._log('Installing NCCL library with Pip...')
                 cuda_major = args.cuda.split('.')[0]
-                # TODO(kmaehashi): The version should not be pinned here, but
-                # unfortunately there's no way to extract the NCCL version
-                # supported by CuPy.
-                nccl_package = f'nvidia-nccl-cu{cuda_major}==2.27.7'
+                nccl_package = (
+                    f'nvidia-nccl-cu{cuda_major}=={args.nccl_version}')
                 cmdline = [
                     *pycommand,
                     '-m',
@@ -133,13 +337,13 @@ class VerifierAgent:
         ]
         self._run(*cmdline, debug_library_load=True)
 
-        try:
-            cmdline = [*pycommand, '-m', 'pytest', *pytest_args]
-            self._run(*cmdline, debug_library_load=True)
-        finally:
-            if args.chown:
-                self._log('Resetting owner/group of the source tree...')
-                self._run('chown', '-R', args.chown, '.')
+        if args.smoke_only:
+            self._log('Smoke test passed; skipping tests')
+            return
+
+        self._run_pytest(
+            pycommand, pytest_args, args.shards, args.junit_dir,
+            'junit' if python is None else f'junit-py{python}')
 
 
 if __name__ == '__main__':
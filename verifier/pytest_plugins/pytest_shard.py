@@ -0,0 +1,26 @@
+"""
+Pytest plugin to run a shard of the collected tests.
+
+The shard is specified as `CUPY_RELEASE_TEST_SHARD=<index>/<count>`.  Tests
+are assigned to shards in a round-robin manner in the order of collection
+so that tests of each module are spread over shards.
+"""
+from __future__ import annotations
+
+import os
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pytest
+
+
+def pytest_collection_modifyitems(
+    config: pytest.Config, items: list[pytest.Item]
+) -> None:
+    shard = os.environ.get('CUPY_RELEASE_TEST_SHARD', None)
+    if shard is None:
+        return
+    index, count = (int(x) for x in shard.split('/'))
+    config.hook.pytest_deselected(items=[
+        item for i, item in enumerate(items) if i % count != index])
+    items[:] = items[index::count]
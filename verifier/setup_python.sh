@@ -9,19 +9,5 @@ if [[ "$(rpm --eval '%{rhel}')" == "7" ]]; then
     export LDFLAGS="-L/usr/lib64/openssl11"
 fi
 
-# Install Python
-for VERSION in ${PYTHON_VERSIONS}; do
-    pyenv install ${VERSION} &
-done
-wait
-
-# Install Python libraries.
-for VERSION in ${PYTHON_VERSIONS}; do \
-    echo "Installing libraries on Python ${VERSION}..."
-    pyenv global ${VERSION}
-    pip install -U pip setuptools
-    pip install pytest mock
-    pip install numpy scipy
-done
-
-# The last version installed will be used to run the verifier agent.
+# Install Python and Python libraries.
+/install_python.sh "${PYTHON_VERSIONS}" pytest mock numpy scipy